@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import timeit
+
+"""
+Run the benchmark suite, and compare against a stored baseline.
+
+    python -m benchmarks                    # run and compare to baseline.json
+    python -m benchmarks --save-baseline    # run and store a new baseline
+    python -m benchmarks -k slitoptimiser --threshold 0.5
+
+Exits with status 1 if any benchmark is slower than the baseline by more than
+the threshold (a fraction, default 0.25, or REFCALC_BENCH_THRESHOLD).
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+
+def measure(func, repeat=5, min_time=0.05):
+    """
+    Best time per call (s) of `func`, from `repeat` rounds of at least
+    `min_time` seconds each.
+    """
+    func()  # warm up, e.g. deferred imports and caches
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a report (list of lines) and the names of any regressions.
+    """
+    lines = [f"{'benchmark':40s} {'time':>12s} {'baseline':>12s} {'ratio':>8s}"]
+    regressions = []
+    for name, t in results.items():
+        base = baseline.get(name)
+        if base is None:
+            lines.append(f"{name:40s} {_fmt(t):>12s} {'-':>12s} {'-':>8s}")
+            continue
+        ratio = t / base
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        lines.append(f"{name:40s} {_fmt(t):>12s} {_fmt(base):>12s} {ratio:8.2f}{flag}")
+    return lines, regressions
+
+
+def _fmt(t):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if t >= scale:
+            return f"{t / scale:.3f} {unit}"
+    return f"{t / 1e-9:.1f} ns"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.environ.get("REFCALC_BENCH_THRESHOLD", 0.25)),
+        help="allowed fractional slowdown before a benchmark fails",
+    )
+    parser.add_argument("-k", dest="pattern", help="only run matching benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-macro", action="store_true", help="skip the routes")
+    args = parser.parse_args(argv)
+
+    # main.py loads bin/config.toml relative to the working directory
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from benchmarks import suite
+
+    benchmarks = suite.load(macro=not args.no_macro)
+    if args.pattern:
+        benchmarks = {k: v for k, v in benchmarks.items() if re.search(args.pattern, k)}
+
+    results = {name: measure(func, args.repeat) for name, func in benchmarks.items()}
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {"machine": platform.platform(), "results": baseline},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write("\n")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    lines, regressions = compare(results, baseline, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import numpy as np
+
+"""
+Benchmark definitions.
+
+Each benchmark is a zero argument callable registered with `benchmark`.
+Micro-benchmarks exercise the calculation functions in `bin` directly,
+macro-benchmarks go through the Flask routes with the test client.
+"""
+
+# {name: callable}
+benchmarks = {}
+
+
+def benchmark(name):
+    def decorator(func):
+        benchmarks[name] = func
+        return func
+
+    return decorator
+
+
+def _micro():
+    from bin import fminbound, slitoptimiser, utils
+
+    gseekfun = lambda x: (x - 0.3) ** 2
+
+    @benchmark("fminbound")
+    def _():
+        fminbound.fminbound(gseekfun, 0, 1)
+
+    lower = np.zeros(1000)
+    centres = np.linspace(0, 1, 1000)
+
+    @benchmark("fminbound_batch[1000]")
+    def _():
+        fminbound.fminbound_batch(lambda x, c: (x - c) ** 2, lower, 1, args=(centres,))
+
+    @benchmark("slitoptimiser[analytic]")
+    def _():
+        slitoptimiser.slitoptimiser(50, 0.033, 1, 2991, 144, verbose=False)
+
+    @benchmark("slitoptimiser[brent]")
+    def _():
+        slitoptimiser.slitoptimiser(
+            50, 0.033, 1, 2991, 144, verbose=False, method="brent"
+        )
+
+    footprints = np.linspace(10, 100, 100)
+    resolutions = np.linspace(0.01, 0.08, 10)[:, None]
+    angles = np.linspace(0.5, 6, 10)[:, None, None]
+
+    @benchmark("slitoptimiser_batch[10000]")
+    def _():
+        slitoptimiser.slitoptimiser_batch(footprints, resolutions, angles, 2991, 144)
+
+    @benchmark("actual_footprint")
+    def _():
+        slitoptimiser.actual_footprint(2.4, 0.72, 2991, 144, 1.0)
+
+    @benchmark("height_of_beam_after_dx")
+    def _():
+        slitoptimiser.height_of_beam_after_dx(2.4, 0.72, 2991, 589)
+
+    @benchmark("utils.div")
+    def _():
+        utils.div(2.4, 0.72, 2991)
+
+    @benchmark("utils.qcalc")
+    def _():
+        utils.qcalc(0.8, 2.8)
+
+    @benchmark("utils.qcrit")
+    def _():
+        utils.qcrit(0, 2.07)
+
+    @benchmark("utils.xraylam")
+    def _():
+        utils.xraylam(8.048)
+
+
+def _macro():
+    import main
+
+    client = main.app.test_client()
+    slits_form = {k: str(v) for k, v in main.defaults().items()}
+    singleslit_form = {"footprint": "50", "resolution": "0.033", "a1": "2"}
+    sld_form = {
+        "formula": "SiO2",
+        "density": "2.2",
+        "volume": "30",
+        "volumetype": "density",
+        "neutron_wavelength": "1.8",
+        "xray_energy": "8.048",
+    }
+
+    def check(response):
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.request.path}: {response.status}")
+
+    @benchmark("GET /slits")
+    def _():
+        check(client.get("/slits"))
+
+    @benchmark("POST /slits")
+    def _():
+        check(client.post("/slits", data=slits_form))
+
+    @benchmark("POST /singleslit")
+    def _():
+        check(client.post("/singleslit", data=singleslit_form))
+
+    @benchmark("POST /singleslit[uncached]")
+    def _():
+        main.slit_cache.clear()
+        check(client.post("/singleslit", data=singleslit_form))
+
+    @benchmark("POST /sld")
+    def _():
+        check(client.post("/sld", data=sld_form))
+
+    @benchmark("POST /sld[uncached]")
+    def _():
+        main.sld.sld_cache.clear()
+        main.sld.formula_cache.clear()
+        check(client.post("/sld", data=sld_form))
+
+
+def load(micro=True, macro=True):
+    """
+    Registers the benchmarks, returning the `benchmarks` dict.
+    """
+    if micro:
+        _micro()
+    if macro:
+        _macro()
+    return benchmarks
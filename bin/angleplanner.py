@@ -0,0 +1,185 @@
+import itertools
+import math
+
+import numpy as np
+
+from . import slitoptimiser, utils
+
+"""
+Choose a set of angles of incidence that covers a target Q range.
+
+For a TOF instrument each angle covers [qcalc(angle, lambdamax),
+qcalc(angle, lambdamin)]. Candidate sets of angles, drawn from a grid, are
+scored in bulk: every set is a row of an array, and coverage, overlap and the
+counting time are calculated for all rows at once.
+"""
+
+
+def _combinations(indices, k, max_sets, rng):
+    """
+    Array (M, k) of combinations of `indices`, all of them if there are at
+    most `max_sets`, otherwise a random sample of (up to) `max_sets`.
+    """
+    indices = np.asarray(indices, dtype=int)
+    if math.comb(indices.size, k) <= max_sets:
+        return np.array(
+            list(itertools.combinations(indices.tolist(), k)), dtype=int
+        ).reshape(-1, k)
+    # draw with replacement, then drop the draws that repeat an index and the
+    # duplicate combinations
+    picks = np.sort(rng.integers(0, indices.size, size=(2 * max_sets, k)), axis=1)
+    picks = picks[np.all(np.diff(picks, axis=1) > 0, axis=1)]
+    return indices[np.unique(picks, axis=0)[:max_sets]]
+
+
+def _candidate_sets(q_lo, q_hi, qmin, qmax, cost, k, max_sets, rng):
+    """
+    Array (M, k) of sorted index sets of k candidates, at most `max_sets` of
+    them, taken in order of decreasing coverage.
+
+    The union of the Q ranges of a set (when it's contiguous) runs from the
+    first to the last angle, so the coverage only depends on those two. The
+    (first, last) pairs are taken in order of decreasing coverage, then of
+    the number of candidates between them (the pairs with the fewest sets
+    come first), and the angles in between are filled with every combination
+    (or a random sample, once `max_sets` is reached).
+    """
+    n = q_lo.size
+    if k == 1:
+        return np.arange(n)[:, None]
+
+    first, last = np.triu_indices(n, 1)
+    coverage = np.minimum(q_hi[last], qmax) - np.maximum(q_lo[first], qmin)
+    fraction = np.round(coverage / (qmax - qmin), 6)
+    order = np.lexsort((cost[first] + cost[last], last - first, -fraction))
+    order = order[coverage[order] > 0]
+    if k == 2:
+        return np.stack([first[order], last[order]], axis=1)[:max_sets]
+
+    sets = []
+    remaining = max_sets
+    for i, j in zip(first[order].tolist(), last[order].tolist()):
+        if j - i - 1 < k - 2:
+            continue
+        middle = _combinations(range(i + 1, j), k - 2, remaining, rng)
+        sets.append(
+            np.column_stack(
+                [np.full(len(middle), i), middle, np.full(len(middle), j)]
+            )
+        )
+        remaining -= len(middle)
+        if remaining <= 0:
+            break
+    if not sets:
+        return np.empty((0, k), dtype=int)
+    return np.concatenate(sets)
+
+
+def plan_angles(
+    qmin,
+    qmax,
+    lambdamin,
+    lambdamax,
+    max_angles=4,
+    min_overlap=0.05,
+    candidates=None,
+    footprint=50,
+    resolution=0.033,
+    L12=2859.5,
+    L2S=276,
+    max_sets=200000,
+    nresults=10,
+):
+    """
+    Rank sets of angles covering a target Q range.
+
+    qmin, qmax - target Q range (A^-1)
+    lambdamin, lambdamax - wavelength band (Angstrom)
+    max_angles - maximum number of angles in a set
+    min_overlap - minimum overlap between the Q ranges of neighbouring angles,
+        as a fraction of the lower angle's Q range
+    candidates - candidate angles (degrees), default a grid from the angle
+        that puts qmin at lambdamax, up to the angle that puts qmax at
+        lambdamin
+    footprint, resolution - used to calculate the slit settings of each angle
+    L12, L2S - collimation distances (mm)
+    max_sets - maximum number of candidate sets scored for each set size.
+        Sets are taken in order of decreasing coverage, see `_candidate_sets`.
+    nresults - number of sets returned
+
+    Counting time is estimated from the intensity through the slits, which
+    for a fixed footprint and dtheta/theta scales as angle**2 (both slit
+    openings scale with angle). Measuring a given Q range therefore costs
+    ~1/angle**2 per unit count, with the reflectivity falling as Q**-4 the
+    time to reach a given statistical precision at the top of a Q range
+    scales as (qmax_i**4 / angle_i**2). The efficiency of a set is 1 over
+    the sum of this over its angles.
+
+    Returns:
+        list of dicts, best first, each with the `angles`, `coverage` (the
+        fraction of the target range that is covered), `overlaps`,
+        `time` (relative counting time), `efficiency`, and the slit
+        settings `d1` and `d2` of each angle.
+    """
+    if not 0 <= min_overlap < np.inf:
+        # with a gap between two ranges the coverage isn't first to last
+        raise ValueError("min_overlap must be >= 0")
+
+    if candidates is None:
+        lo = np.degrees(np.arcsin(qmin * lambdamax / 4 / np.pi))
+        hi = np.degrees(np.arcsin(min(qmax * lambdamin / 4 / np.pi, 1)))
+        candidates = np.unique(np.round(np.geomspace(lo, hi, 40), 3))
+    candidates = np.sort(np.asarray(candidates, dtype=float))
+
+    q_lo = utils.qcalc(candidates, lambdamax)
+    q_hi = utils.qcalc(candidates, lambdamin)
+    cost = np.power(q_hi, 4) / np.power(candidates, 2)
+
+    # seeded, so that the same request gives the same plans
+    rng = np.random.default_rng(0)
+    results = []
+    for k in range(1, max_angles + 1):
+        sets = _candidate_sets(q_lo, q_hi, qmin, qmax, cost, k, max_sets, rng)
+        if not sets.size:
+            continue
+        lo, hi = q_lo[sets], q_hi[sets]
+
+        # overlap between neighbouring angles (sets are sorted by angle)
+        overlap = (hi[:, :-1] - lo[:, 1:]) / (hi[:, :-1] - lo[:, :-1])
+        ok = np.all(overlap >= min_overlap, axis=1)
+
+        # the union of the ranges is contiguous if all overlaps are >= 0
+        covered = np.minimum(hi[:, -1], qmax) - np.maximum(lo[:, 0], qmin)
+        coverage = np.clip(covered / (qmax - qmin), 0, 1)
+        time = cost[sets].sum(axis=1)
+
+        keep = np.flatnonzero(ok & (coverage > 0))
+        # only the best `nresults` of each set size can make the final list
+        order = np.lexsort((time[keep], -np.round(coverage[keep], 6)))
+        for i in keep[order[:nresults]]:
+            results.append((coverage[i], time[i], sets[i], overlap[i]))
+
+    # rank by coverage, then by counting time
+    results.sort(key=lambda r: (-round(r[0], 6), r[1]))
+    results = results[:nresults]
+
+    out = []
+    for coverage, time, idx, overlap in results:
+        angles = candidates[idx]
+        d1, d2 = slitoptimiser.slitoptimiser_batch(
+            footprint, resolution, angles, L12=L12, L2S=L2S, method="table"
+        )
+        out.append(
+            {
+                "angles": angles.tolist(),
+                "qmin": q_lo[idx].tolist(),
+                "qmax": q_hi[idx].tolist(),
+                "coverage": float(coverage),
+                "overlaps": overlap.tolist(),
+                "time": float(time),
+                "efficiency": float(1 / time),
+                "d1": d1.tolist(),
+                "d2": d2.tolist(),
+            }
+        )
+    return out
@@ -0,0 +1,115 @@
+import math
+
+import numpy as np
+
+"""
+Beam intensity profile at the sample, and the fraction of the beam intercepted
+by a sample.
+
+At a distance D after slit 2 each point sees slit 1 through slit 2, so the
+intensity profile across the beam is the convolution of the two slit openings
+projected onto that plane, of widths
+
+    w1 = d1 * D / L12
+    w2 = d2 * (L12 + D) / L12
+
+which is a trapezoid. The full width of its base is w1 + w2 (the penumbra of
+`slitoptimiser.height_of_beam_after_dx`) and the full width of its flat top is
+|w2 - w1|.
+
+All functions broadcast over their arguments.
+"""
+
+
+def trapezoid(d1, d2, L12, L2S):
+    """
+    Half widths of the trapezoidal beam profile at the sample.
+
+    d1, d2 - slit openings (mm)
+    L12 - distance between the collimation slits (mm)
+    L2S - distance from slit 2 to the sample (mm)
+
+    Returns:
+        (a, b), half width of the flat top and of the base (mm)
+    """
+    w1 = d1 * L2S / L12
+    w2 = d2 * (L12 + L2S) / L12
+    return np.abs(w2 - w1) / 2, (w1 + w2) / 2
+
+
+def profile(z, d1, d2, L12, L2S):
+    """
+    Beam intensity at height z (mm) from the beam centre, normalised to unit
+    area.
+    """
+    a, b = trapezoid(d1, d2, L12, L2S)
+    z = np.abs(z)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ramp = np.where(b > a, (b - z) / (b - a), 0)
+    intensity = np.where(z <= a, 1.0, np.clip(ramp, 0, 1))
+    return intensity / (a + b)
+
+
+def _cumulative(x, a, b):
+    """
+    Integral of the (unit height) trapezoid from 0 to x >= 0.
+    """
+    x = np.minimum(x, b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ramp = x - np.where(b > a, np.power(x - a, 2) / (2 * (b - a)), 0)
+    return np.where(x <= a, x, ramp)
+
+
+def beam_fraction(d1, d2, L12, L2S, angle, length, width=None, diagonal=False):
+    """
+    Fraction of the beam intercepted by a sample, calculated analytically.
+
+    d1, d2 - slit openings (mm)
+    L12 - distance between the collimation slits (mm)
+    L2S - distance from slit 2 to the sample (mm)
+    angle - angle of incidence (degrees)
+    length - length of the sample along the beam (mm)
+    width - width of the sample (mm), needed if `diagonal`
+    diagonal - the sample is rotated so that the beam runs along its diagonal,
+        its effective length is then sqrt(length**2 + width**2)
+
+    Returns:
+        fraction of the beam intensity that hits the sample, in [0, 1]
+    """
+    if all(type(v) is float for v in (d1, d2, L12, L2S, angle, length)):
+        # plain floats (e.g. one row of the angulator), avoid numpy overhead
+        return _beam_fraction_scalar(d1, d2, L12, L2S, angle, length, width, diagonal)
+    if diagonal:
+        length = np.hypot(length, width)
+    height = length * np.sin(np.radians(angle))
+    a, b = trapezoid(d1, d2, L12, L2S)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = 2 * _cumulative(height / 2, a, b) / (a + b)
+    # a closed slit has no beam to intercept
+    return np.where(a + b > 0, fraction, 0.0)
+
+
+def _beam_fraction_scalar(d1, d2, L12, L2S, angle, length, width, diagonal):
+    # `beam_fraction` for floats
+    if diagonal:
+        length = math.hypot(length, width)
+    x = length * math.sin(math.radians(angle)) / 2
+    w1 = d1 * L2S / L12
+    w2 = d2 * (L12 + L2S) / L12
+    a, b = abs(w2 - w1) / 2, (w1 + w2) / 2
+    if not a + b > 0:
+        return 0.0
+    x = min(x, b)
+    if x > a:
+        x -= (x - a) ** 2 / (2 * (b - a))
+    return 2 * x / (a + b)
+
+
+def transmitted_intensity(d1, d2, L12, L2S, angle, length, width=None, diagonal=False):
+    """
+    Intensity hitting the sample, relative to the open area of the slits.
+    Proportional to d1 * d2 / L12 (the phase space accepted by the
+    collimation) times the `beam_fraction`.
+    """
+    fraction = beam_fraction(d1, d2, L12, L2S, angle, length, width, diagonal)
+    return d1 * d2 / L12 * fraction
@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+
+"""
+Small, thread-safe caches used to avoid repeating calculations for the
+same inputs.
+"""
+
+
+class LRUCache:
+    """
+    Size-bounded least-recently-used cache.
+
+    Parameters:
+        maxsize - maximum number of entries held. When the cache is full the
+            least recently used entry is evicted.
+
+    Attributes:
+        hits, misses, evictions - counters
+    """
+
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, keys, default=None):
+        """
+        Returns a list of the cached values of `keys` (`default` for those
+        that aren't cached), with one acquisition of the lock.
+        """
+        data = self._data
+        move_to_end = data.move_to_end
+        values = []
+        misses = 0
+        with self._lock:
+            for key in keys:
+                value = data.get(key, _missing)
+                if value is _missing:
+                    misses += 1
+                    values.append(default)
+                else:
+                    move_to_end(key)
+                    values.append(value)
+            self.misses += misses
+            self.hits += len(values) - misses
+        return values
+
+    def put_many(self, items):
+        """
+        Stores several (key, value) pairs, with one acquisition of the lock.
+        """
+        data = self._data
+        with self._lock:
+            for key, value in items:
+                if key in data:
+                    data.move_to_end(key)
+                data[key] = value
+            while len(data) > self.maxsize:
+                data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, func, *args, **kwds):
+        """
+        Returns the cached value for `key`, calculating and storing
+        `func(*args, **kwds)` on a miss.
+        """
+        sentinel = _missing
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = func(*args, **kwds)
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Returns a dict of the cache counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_missing = object()
+
+
+def quantise(*values, digits=9):
+    """
+    Normalise floats so that they can be used as (part of) a cache key.
+    Values are rounded to `digits` significant figures.
+    """
+    return tuple(float(f"{float(v):.{digits}g}") for v in values)
@@ -0,0 +1,152 @@
+import threading
+
+import numpy as np
+
+from . import sld
+
+"""
+Contrast variation: neutron SLD of a molecule with exchangeable hydrogens, and
+of a H2O/D2O (or other protonated/deuterated) solvent mixture, as a function of
+the deuterated fraction of the solvent. Used to find the contrast match point.
+
+The coherent scattering lengths and masses of every element and isotope are
+held in NumPy arrays, so that the SLD of a composition is a dot product rather
+than a new periodictable calculation.
+"""
+
+
+class ScatteringTable:
+    """
+    Coherent neutron scattering lengths (fm) and masses (g/mol) of every atom
+    (element or isotope) known to periodictable, as NumPy arrays.
+
+    Attributes:
+        index - {atom: position in the arrays}
+        b_c - coherent scattering lengths (fm)
+        mass - atomic masses (g/mol)
+    """
+
+    def __init__(self):
+        pt = sld.periodictable.load()
+        atoms = [iso for el in pt.elements for iso in [el, *el]]
+        self.index = {atom: i for i, atom in enumerate(atoms)}
+        self.b_c = np.array(
+            [_finite(getattr(atom.neutron, "b_c", None)) for atom in atoms]
+        )
+        self.mass = np.array([_finite(atom.mass) for atom in atoms])
+
+    def composition(self, compound):
+        """
+        Vector holding the number of each atom in a compound.
+        """
+        vector = np.zeros(self.b_c.size)
+        for atom, count in sld.formula(compound).atoms.items():
+            vector[self.index[atom]] += count
+        return vector
+
+
+def _finite(value):
+    value = np.nan if value is None else float(value)
+    return value if np.isfinite(value) else 0.0
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def scattering_table():
+    """
+    The `ScatteringTable`, built on first use.
+    """
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = ScatteringTable()
+    return _table
+
+
+def sld_from_composition(compositions, volume):
+    """
+    Neutron SLD (10^-6 A^-2) of one or more compositions.
+
+    compositions - array (..., n_atoms) of atom counts
+    volume - molecular volume (A^3)
+    """
+    # 1 fm = 1e-5 A, and the SLD is reported in units of 1e-6 A^-2
+    return 10.0 * (compositions @ scattering_table().b_c) / volume
+
+
+def contrast_match(
+    compound,
+    density,
+    exchangeable=0,
+    exchange_efficiency=1.0,
+    solvent=("H2O", "D2O"),
+    solvent_density=(0.997, 1.107),
+    points=101,
+):
+    """
+    SLD of a molecule and of a solvent mixture as a function of the
+    deuterated solvent fraction, and the contrast match point.
+
+    compound - formula string of the molecule (protonated form)
+    density - mass density of the molecule (g/cm^3)
+    exchangeable - number of labile hydrogens in the molecule, which exchange
+        with the hydrogen isotope of the solvent
+    exchange_efficiency - fraction of the labile hydrogens that do exchange
+    solvent - formula strings of the protonated and deuterated solvent
+    solvent_density - mass densities (g/cm^3) of the two solvents
+    points - number of points in the deuterated fraction grid, [0, 1], at
+        least 2
+
+    Returns:
+        dict with the grid `fraction`, `molecule_sld`, `solvent_sld` and the
+        `match_point`, the deuterated solvent fraction at which the molecule
+        and the solvent have the same SLD (None if they never do).
+
+    """
+    if int(points) < 2:
+        raise ValueError("points must be at least 2")
+    table = scattering_table()
+    fraction = np.linspace(0, 1, int(points))
+
+    # molecular volume is taken to be unchanged by deuteration
+    base = table.composition(compound)
+    hydrogen = table.composition("H")
+    if exchangeable > base @ hydrogen:
+        raise ValueError("more exchangeable hydrogens than there are hydrogens")
+    volume = sld.volume_from_density(compound, density)
+    labile = exchangeable * exchange_efficiency
+    exchange = labile * (table.composition("H[2]") - hydrogen)
+    compositions = base + fraction[:, None] * exchange
+    molecule_sld = sld_from_composition(compositions, volume)
+
+    # solvent mixtures are by volume fraction
+    solvent_slds = np.array(
+        [
+            sld_from_composition(
+                table.composition(s), sld.volume_from_density(s, rho)
+            )
+            for s, rho in zip(solvent, solvent_density)
+        ]
+    )
+    solvent_sld = (1 - fraction) * solvent_slds[0] + fraction * solvent_slds[1]
+
+    # both SLDs are linear in the deuterated fraction
+    difference = molecule_sld - solvent_sld
+    slope = difference[-1] - difference[0]
+    match_point = None
+    if slope != 0:
+        x = -difference[0] / slope
+        if 0 <= x <= 1:
+            match_point = float(x)
+
+    return {
+        "fraction": fraction,
+        "molecule_sld": molecule_sld,
+        "solvent_sld": solvent_sld,
+        "volume": volume,
+        "match_point": match_point,
+    }
+
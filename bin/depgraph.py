@@ -0,0 +1,132 @@
+import operator
+
+from . import cache
+
+"""
+A small dependency graph of derived values.
+
+Each node is a function of input values and/or other nodes. Node values are
+memoised on the values of the inputs that they (transitively) depend on, so
+evaluating the graph again with some inputs changed only recomputes the
+nodes downstream of those inputs.
+"""
+
+
+class Graph:
+    """
+    Dependency graph of memoised nodes.
+
+    Parameters:
+        inputs - names of the input values
+        maxsize - maximum number of memoised node values
+
+    Attributes:
+        memo - `cache.LRUCache` of node values, keyed on
+            (node, input values)
+    """
+
+    def __init__(self, inputs, maxsize=4096):
+        self.inputs = tuple(inputs)
+        self.memo = cache.LRUCache(maxsize)
+        self._nodes = {}
+        # the inputs each node depends on, directly or through other nodes
+        self._depends = {name: (name,) for name in self.inputs}
+        self._batches = []
+
+    @property
+    def nodes(self):
+        """
+        Names of the nodes, in evaluation order.
+        """
+        return tuple(self._nodes)
+
+    def __contains__(self, name):
+        return name in self._nodes or name in self._depends
+
+    def node(self, name, func, *deps):
+        """
+        Adds a node calculated as `func(*[value of dep for dep in deps])`.
+        Dependencies must be inputs or nodes that were already added, so
+        nodes are kept in a valid evaluation order.
+        """
+        if name in self:
+            raise ValueError(f"{name!r} is already in the graph")
+        unknown = [dep for dep in deps if dep not in self]
+        if unknown:
+            raise ValueError(f"unknown dependencies {unknown} of {name!r}")
+
+        depends = {i for dep in deps for i in self._depends[dep]}
+        self._depends[name] = tuple(i for i in self.inputs if i in depends)
+        self._nodes[name] = (func, deps, _getter(self._depends[name]))
+
+    def batch(self, func, *names):
+        """
+        Calculates those of the nodes `names` that need recomputing together,
+        as `func([[value of dep for dep in deps] for each node])`, which
+        returns a list of their values. The nodes must depend only on inputs.
+        Nodes are still memoised individually.
+        """
+        for name in names:
+            if name not in self._nodes:
+                raise ValueError(f"unknown node {name!r}")
+            if any(dep not in self.inputs for dep in self._nodes[name][1]):
+                raise ValueError(f"{name!r} must only depend on inputs")
+        self._batches.append((func, names))
+
+    def evaluate(self, values):
+        """
+        Evaluates every node.
+
+        Parameters:
+            values - dict of input values. Input values need to be hashable.
+
+        Returns:
+            (values, recomputed)
+            values is a dict of the input and node values, recomputed is a
+            list of the nodes that weren't memoised.
+        """
+        values = {name: values[name] for name in self.inputs}
+        nodes = self._nodes
+        # node keys only depend on the inputs, so look them all up at once
+        keys = [(name,) + inputs(values) for name, (_, _, inputs) in nodes.items()]
+        memoised = self.memo.get_many(keys, _missing)
+        missing = {name for name, value in zip(nodes, memoised) if value is _missing}
+        if not missing:
+            values.update(zip(nodes, memoised))
+            return values, []
+
+        batched = {}
+        for func, names in self._batches:
+            names = [name for name in names if name in missing]
+            if len(names) > 1:
+                args = [[values[dep] for dep in nodes[name][1]] for name in names]
+                batched.update(zip(names, func(args)))
+
+        recomputed = []
+        computed = []
+        for key, value, (name, (func, deps, _)) in zip(keys, memoised, nodes.items()):
+            if value is _missing:
+                if name in batched:
+                    value = batched[name]
+                else:
+                    value = func(*[values[dep] for dep in deps])
+                computed.append((key, value))
+                recomputed.append(name)
+            values[name] = value
+        self.memo.put_many(computed)
+        return values, recomputed
+
+
+def _getter(names):
+    """
+    Function returning the tuple of the values of `names` in a dict.
+    """
+    if not names:
+        return lambda values: ()
+    if len(names) == 1:
+        name = names[0]
+        return lambda values: (values[name],)
+    return operator.itemgetter(*names)
+
+
+_missing = object()
@@ -0,0 +1,88 @@
+import io
+
+import numpy as np
+
+"""
+Beam envelope along the whole flight path, from before slit 1 to the
+detector.
+
+Positions, z, are measured along the beam from the first collimation slit.
+At a fraction t = z / L12 of the way from slit 1 to slit 2 (t can be < 0 or
+> 1) the beam profile is the convolution of the two slit openings projected
+onto that plane, of widths |1 - t| * d1 and |t| * d2. Its full width (the
+penumbra) is their sum and its flat top (the umbra) their difference. The
+penumbra is the same as that from `slitoptimiser.height_of_beam_after_dx`,
+and at the sample the widths are those of `beamprofile.trapezoid`.
+
+After the sample the centre of the reflected beam rises at 2 * angle. The
+sample is assumed to reflect the whole beam.
+"""
+
+CHANNELS = ("centre", "umbra", "penumbra")
+
+
+def positions(L12, L2S, LpreS1, LSD=2500, npoints=1000):
+    """
+    Evenly spaced positions (mm) from the slit before slit 1 to the detector.
+    """
+    return np.linspace(-LpreS1, L12 + L2S + LSD, int(npoints))
+
+
+def markers(L12, L2S, LS4, LpreS1, LSD=2500):
+    """
+    Positions (mm) of the slits, sample and detector, keyed by name.
+    """
+    return {
+        "preS1": -LpreS1,
+        "S1": 0.0,
+        "S2": L12,
+        "sample": L12 + L2S,
+        "S4": L12 + L2S + LS4,
+        "detector": L12 + L2S + LSD,
+    }
+
+
+def envelope(d1, d2, angles, z, L12, L2S, dtype=np.float32):
+    """
+    Beam envelope for every (angle, position) in one broadcast.
+
+    Parameters:
+        d1, d2 - slit openings for each angle (mm), shape (N,)
+        angles - angles of incidence (degrees), shape (N,)
+        z - positions along the beam from slit 1 (mm), shape (M,)
+        L12 - distance between the collimation slits (mm)
+        L2S - distance from slit 2 to the sample (mm)
+        dtype - dtype of the returned array
+
+    Returns:
+        array of shape (3, N, M), the height of the beam centre, the full
+        width of the umbra, and the full width of the penumbra (mm); see
+        CHANNELS.
+    """
+    angles = np.atleast_1d(np.asarray(angles, dtype=float))[:, None]
+    d1 = np.broadcast_to(np.asarray(d1, dtype=float), angles.shape[:1])[:, None]
+    d2 = np.broadcast_to(np.asarray(d2, dtype=float), angles.shape[:1])[:, None]
+    z = np.asarray(z, dtype=float)[None, :]
+
+    t = z / L12
+    w1 = np.abs(1 - t) * d1
+    w2 = np.abs(t) * d2
+
+    out = np.empty((3, angles.shape[0], z.shape[1]), dtype=dtype)
+    after = np.maximum(z - (L12 + L2S), 0)
+    np.multiply(after, np.tan(np.radians(2 * angles)), out=out[0], casting="unsafe")
+    np.abs(w1 - w2, out=out[1], casting="unsafe")
+    np.add(w1, w2, out=out[2], casting="unsafe")
+    return out
+
+
+def npy_header(array):
+    """
+    The .npy header (magic string included) for `array`. Followed by the
+    array's buffer it makes a complete .npy file.
+    """
+    fp = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        fp, np.lib.format.header_data_from_array_1_0(array)
+    )
+    return fp.getvalue()
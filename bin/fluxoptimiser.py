@@ -0,0 +1,145 @@
+import numpy as np
+
+from . import beamprofile, slitoptimiser
+
+"""
+Flux-optimal collimation: the inverse of `slitoptimiser`.
+
+Given a sample length, the coarsest acceptable angular resolution and a set of
+angles, find the slit openings (d1, d2), and hence the resolution, that
+maximise the intensity on the sample for each angle, while keeping the
+penumbra footprint on the sample.
+
+All angles are solved together by a vectorised coarse-to-fine grid search over
+(d1, d2), starting from the `slitoptimiser` solution at the coarsest resolution.
+"""
+
+OBJECTIVES = ("slits", "beamfraction")
+
+
+def _objective(d1, d2, L12, L2S, angle, length, width, diagonal, objective):
+    if objective == "slits":
+        # intensity through the collimation is proportional to d1 * d2
+        return d1 * d2
+    return beamprofile.transmitted_intensity(
+        d1, d2, L12, L2S, angle, length, width, diagonal
+    )
+
+
+def flux_optimise(
+    length,
+    max_resolution,
+    angles,
+    L12=2859.5,
+    L2S=276,
+    objective="slits",
+    width=None,
+    diagonal=False,
+    npoints=33,
+    levels=6,
+):
+    """
+    Find the slit openings that maximise flux for each angle.
+
+    length - sample length (mm). The penumbra footprint is kept within it
+        (or within the diagonal, if `diagonal`).
+    max_resolution - the coarsest acceptable dtheta/theta (FWHM)
+    angles - angles of incidence (degrees)
+    L12 - slit1-slit2 distance (mm)
+    L2S - slit2-sample distance (mm)
+    objective - "slits", flux proportional to d1 * d2, or "beamfraction",
+        flux proportional to d1 * d2 times the fraction of the beam
+        intercepted by the sample (`beamprofile.beam_fraction`)
+    width, diagonal - see `beamprofile.beam_fraction`
+    npoints - number of grid points along d1 and d2 at each level
+    levels - number of coarse-to-fine refinements
+
+    Returns:
+        dict of arrays, one element per angle: d1, d2, resolution (the
+        dtheta/theta achieved), footprint (penumbra) and flux (the objective)
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}")
+
+    if diagonal and width is None:
+        raise ValueError("the sample width is needed for diagonal rotation")
+    # the footprint has to fit along the direction of the beam
+    footprint_limit = np.hypot(length, width) if diagonal else length
+
+    angles = np.atleast_1d(np.asarray(angles, dtype=float))
+    theta = np.radians(angles)
+    n = angles.size
+
+    # The search is over (resolution, phi), with
+    #     d1 = rho * cos(phi), d2 = rho * sin(phi)
+    #     dtheta = 0.68 * rho / L12 = resolution * theta
+    # so the resolution constraint is a bound on the search, and the feasible
+    # region doesn't become a thin wedge between the two constraints.
+    lo_res = np.zeros(n)
+    hi_res = np.full(n, float(max_resolution))
+    lo_phi = np.zeros(n)
+    hi_phi = np.full(n, np.pi / 2)
+    grid = np.linspace(0, 1, npoints)
+
+    # Seed the search with the closed-form `slitoptimiser` solution at the
+    # coarsest resolution. It maximises d1 * d2 for the footprint, so it is
+    # the optimum of the "slits" objective, which a grid only approaches.
+    seed_d1, seed_d2 = slitoptimiser.slitoptimiser_batch(
+        footprint_limit, max_resolution, angles, L12=L12, L2S=L2S
+    )
+    best = _objective(
+        seed_d1, seed_d2, L12, L2S, angles, length, width, diagonal, objective
+    )
+    best = np.nan_to_num(np.asarray(best, dtype=float), nan=-np.inf)
+    best_res = 0.68 * np.hypot(seed_d1, seed_d2) / L12 / theta
+    best_phi = np.arctan2(seed_d2, seed_d1)
+
+    for level in range(levels):
+        # (N, npoints, 1) and (N, 1, npoints)
+        res = (lo_res[:, None] + (hi_res - lo_res)[:, None] * grid)[:, :, None]
+        phi = (lo_phi[:, None] + (hi_phi - lo_phi)[:, None] * grid)[:, None, :]
+        a = angles[:, None, None]
+
+        rho = res * theta[:, None, None] * L12 / 0.68
+        d1 = rho * np.cos(phi)
+        d2 = rho * np.sin(phi)
+
+        penumbra = slitoptimiser.actual_footprint(d1, d2, L12, L2S, a)[1]
+        flux = _objective(d1, d2, L12, L2S, a, length, width, diagonal, objective)
+        flux = np.where(
+            penumbra <= footprint_limit, np.nan_to_num(flux, nan=-np.inf), -np.inf
+        )
+
+        flat = flux.reshape(n, -1)
+        idx = np.argmax(flat, axis=1)
+        value = flat[np.arange(n), idx]
+        i, j = np.unravel_index(idx, (npoints, npoints))
+
+        improved = value > best
+        best = np.where(improved, value, best)
+        best_res = np.where(improved, res[np.arange(n), i, 0], best_res)
+        best_phi = np.where(improved, phi[np.arange(n), 0, j], best_phi)
+
+        # zoom in around the best point, to +/- 2 grid spacings
+        step_res = 2 * (hi_res - lo_res) / (npoints - 1)
+        step_phi = 2 * (hi_phi - lo_phi) / (npoints - 1)
+        lo_res = np.maximum(best_res - step_res, 0)
+        hi_res = np.minimum(best_res + step_res, max_resolution)
+        lo_phi = np.maximum(best_phi - step_phi, 0)
+        hi_phi = np.minimum(best_phi + step_phi, np.pi / 2)
+
+    rho = best_res * theta * L12 / 0.68
+    best_d1 = rho * np.cos(best_phi)
+    best_d2 = rho * np.sin(best_phi)
+
+    dtheta = 0.68 * np.sqrt(best_d1**2 + best_d2**2) / L12
+    return {
+        "angles": angles,
+        "d1": best_d1,
+        "d2": best_d2,
+        "resolution": dtheta / theta,
+        "footprint": slitoptimiser.actual_footprint(
+            best_d1, best_d2, L12, L2S, angles
+        )[1],
+        "flux": best,
+    }
@@ -240,6 +240,196 @@ def _minimize_scalar_bounded(
         }.get(flag, ""),
         x=xf,
         nfev=num,
+        nit=num - 1,
+    )
+
+    return result
+
+
+def fminbound_batch(func, x1, x2, args=(), xtol=1e-5, maxfun=500, full_output=0):
+    """Bounded minimization of many independent scalar problems at once.
+
+    Parameters
+    ----------
+    func : callable f(x,*args)
+        Vectorised objective function to be minimized. `x` is a 1-D array
+        holding the current point of each problem that has not yet
+        converged, and must return an array of the same shape.
+    x1, x2 : array_like
+        The optimization bounds of each problem. They are broadcast against
+        each other.
+    args : tuple, optional
+        Extra arguments passed to function. Any argument that is an array
+        with the broadcast shape of the bounds is taken to be per-problem,
+        and is subset to the unconverged problems before calling `func`.
+    xtol : float, optional
+        The convergence tolerance.
+    maxfun : int, optional
+        Maximum number of function evaluations allowed for each problem.
+    full_output : bool, optional
+        If True, return optional outputs.
+
+    Returns
+    -------
+    xopt : ndarray
+        Parameters (over given interval) which minimize the
+        objective function of each problem.
+    fval : ndarray
+        The function value at the minimum point of each problem.
+    ierr : ndarray
+        An error flag for each problem (0 if converged, 1 if maximum number
+        of function calls reached).
+    numfunc : ndarray
+      The number of function calls made for each problem.
+
+    See also
+    --------
+    fminbound : the scalar version.
+
+    Notes
+    -----
+    Each problem takes exactly the same sequence of Brent steps as it would
+    with `fminbound`, but all the problems are advanced together. Problems
+    that have converged stop being evaluated.
+
+    """
+    options = {"xtol": xtol, "maxiter": maxfun}
+
+    res = _minimize_scalar_bounded_batch(func, (x1, x2), args, **options)
+    if full_output:
+        return res["x"], res["fun"], res["status"], res["nfev"]
+    else:
+        return res["x"]
+
+
+def _minimize_scalar_bounded_batch(
+    func, bounds, args=(), xtol=1e-5, maxiter=500, **unknown_options
+):
+    maxfun = maxiter
+    # Test bounds are of correct form
+    if len(bounds) != 2:
+        raise ValueError("bounds must have two elements.")
+    x1, x2 = numpy.broadcast_arrays(
+        numpy.asarray(bounds[0], dtype=float), numpy.asarray(bounds[1], dtype=float)
+    )
+    shape = x1.shape
+    if numpy.any(x1 > x2):
+        raise ValueError("The lower bound exceeds the upper bound.")
+
+    x1 = x1.ravel()
+    x2 = x2.ravel()
+    n = x1.size
+    args = tuple(
+        numpy.ravel(arg) if numpy.shape(arg) == shape and shape != () else arg
+        for arg in args
+    )
+
+    def _func(x, lanes):
+        _args = tuple(
+            arg[lanes] if isinstance(arg, numpy.ndarray) and arg.shape == (n,) else arg
+            for arg in args
+        )
+        return numpy.asarray(func(x, *_args), dtype=float)
+
+    sqrt_eps = sqrt(2.2e-16)
+    golden_mean = 0.5 * (3.0 - sqrt(5.0))
+    a, b = x1.copy(), x2.copy()
+    fulc = a + golden_mean * (b - a)
+    nfc, xf = fulc.copy(), fulc.copy()
+    rat = numpy.zeros(n)
+    e = numpy.zeros(n)
+    fx = _func(xf, numpy.arange(n))
+    num = numpy.ones(n, dtype=int)
+    flag = numpy.zeros(n, dtype=int)
+
+    ffulc, fnfc = fx.copy(), fx.copy()
+    xm = 0.5 * (a + b)
+    tol1 = sqrt_eps * numpy.abs(xf) + xtol / 3.0
+    tol2 = 2.0 * tol1
+
+    active = numpy.abs(xf - xm) > (tol2 - 0.5 * (b - a))
+    while numpy.any(active):
+        lanes = numpy.flatnonzero(active)
+        _a, _b, _xf, _fx = a[lanes], b[lanes], xf[lanes], fx[lanes]
+        _nfc, _fnfc, _fulc, _ffulc = nfc[lanes], fnfc[lanes], fulc[lanes], ffulc[lanes]
+        _e, _rat, _xm = e[lanes], rat[lanes], xm[lanes]
+        _tol1, _tol2 = tol1[lanes], tol2[lanes]
+
+        # Check for parabolic fit
+        parabolic = numpy.abs(_e) > _tol1
+        r = (_xf - _nfc) * (_fx - _ffulc)
+        q = (_xf - _fulc) * (_fx - _fnfc)
+        p = (_xf - _fulc) * q - (_xf - _nfc) * r
+        q = 2.0 * (q - r)
+        p = numpy.where(q > 0.0, -p, p)
+        q = numpy.abs(q)
+        r = _e
+        _e = numpy.where(parabolic, _rat, _e)
+
+        # Check for acceptability of parabola
+        accept = (
+            parabolic
+            & (numpy.abs(p) < numpy.abs(0.5 * q * r))
+            & (p > q * (_a - _xf))
+            & (p < q * (_b - _xf))
+        )
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            _rat = numpy.where(accept, p / q, _rat)
+        x = _xf + _rat
+        near_bound = accept & (((x - _a) < _tol2) | ((_b - x) < _tol2))
+        si = numpy.sign(_xm - _xf) + ((_xm - _xf) == 0)
+        _rat = numpy.where(near_bound, _tol1 * si, _rat)
+
+        # Do a golden-section step
+        golden = ~accept
+        _e = numpy.where(golden, numpy.where(_xf >= _xm, _a - _xf, _b - _xf), _e)
+        _rat = numpy.where(golden, golden_mean * _e, _rat)
+
+        si = numpy.sign(_rat) + (_rat == 0)
+        x = _xf + si * numpy.maximum(numpy.abs(_rat), _tol1)
+        fu = _func(x, lanes)
+        num[lanes] += 1
+
+        better = fu <= _fx
+        worse = ~better
+        c1 = worse & ((fu <= _fnfc) | (_nfc == _xf))
+        c2 = worse & ~c1 & ((fu <= _ffulc) | (_fulc == _xf) | (_fulc == _nfc))
+
+        a[lanes] = numpy.where(
+            better, numpy.where(x >= _xf, _xf, _a), numpy.where(x < _xf, x, _a)
+        )
+        b[lanes] = numpy.where(
+            better, numpy.where(x >= _xf, _b, _xf), numpy.where(x < _xf, _b, x)
+        )
+        fulc[lanes] = numpy.where(better | c1, _nfc, numpy.where(c2, x, _fulc))
+        ffulc[lanes] = numpy.where(better | c1, _fnfc, numpy.where(c2, fu, _ffulc))
+        nfc[lanes] = numpy.where(better, _xf, numpy.where(c1, x, _nfc))
+        fnfc[lanes] = numpy.where(better, _fx, numpy.where(c1, fu, _fnfc))
+        xf[lanes] = numpy.where(better, x, _xf)
+        fx[lanes] = numpy.where(better, fu, _fx)
+        e[lanes] = _e
+        rat[lanes] = _rat
+
+        xm[lanes] = 0.5 * (a[lanes] + b[lanes])
+        tol1[lanes] = sqrt_eps * numpy.abs(xf[lanes]) + xtol / 3.0
+        tol2[lanes] = 2.0 * tol1[lanes]
+
+        exhausted = num[lanes] >= maxfun
+        flag[lanes[exhausted]] = 1
+        active[lanes] = ~exhausted & (
+            numpy.abs(xf[lanes] - xm[lanes]) > (tol2[lanes] - 0.5 * (b[lanes] - a[lanes]))
+        )
+
+    result = Result(
+        fun=fx.reshape(shape),
+        status=flag.reshape(shape),
+        success=(flag == 0).reshape(shape),
+        message=numpy.where(
+            flag == 0, "Solution found.", "Maximum number of function calls reached."
+        ).reshape(shape),
+        x=xf.reshape(shape),
+        nfev=num.reshape(shape),
+        nit=num.reshape(shape) - 1,
     )
 
     return result
@@ -0,0 +1,152 @@
+import logging
+import os
+import threading
+import time
+import tomllib
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+from . import slitoptimiser
+
+"""
+Registry of instrument profiles loaded from config.toml.
+
+Profiles are immutable, so they can be shared freely between threads. The
+registry holds a read-only snapshot of all the profiles; when config.toml
+changes on disk a new snapshot is built and swapped in, readers never take a
+lock.
+"""
+
+logger = logging.getLogger(__name__)
+
+DISTANCES = ("L12", "L2S", "LS4", "LpreS1")
+
+
+@dataclass(frozen=True)
+class InstrumentProfile:
+    """
+    Geometry of a reflectometer, with quantities derived from it.
+
+    name - instrument name
+    L12 - slit1-slit2 distance (mm)
+    L2S - slit2-sample distance (mm)
+    LS4 - sample-slit4 distance (mm)
+    LpreS1 - distance from the slit before slit1 to slit1 (mm)
+    """
+
+    name: str
+    L12: float
+    L2S: float
+    LS4: float
+    LpreS1: float
+    ratio: float = field(init=False)
+    slit_table: slitoptimiser.SlitTable = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "ratio", self.L2S / self.L12)
+        object.__setattr__(
+            self, "slit_table", slitoptimiser.build_slit_table(self.L12, self.L2S)
+        )
+
+    def distances(self):
+        """
+        The distances as a dict, {"L12": ..., "L2S": ..., ...}.
+        """
+        return {k: getattr(self, k) for k in DISTANCES}
+
+
+def load_profiles(path):
+    """
+    Read instrument profiles from a TOML file.
+
+    Each instrument is a table of the DISTANCES, which must be positive
+    numbers.
+
+    Returns:
+        read-only mapping of {name: InstrumentProfile}
+
+    Raises:
+        ValueError if an instrument isn't a table or a distance is missing
+        or invalid
+    """
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+    profiles = {}
+    for name, settings in config.items():
+        if not isinstance(settings, dict):
+            raise ValueError(f"{name!r} should be a table of distances")
+        distances = []
+        for k in DISTANCES:
+            if k not in settings:
+                raise ValueError(f"{name!r} is missing {k}")
+            value = settings[k]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"{name}.{k} should be a number")
+            if not 0 < value < float("inf"):
+                raise ValueError(f"{name}.{k} should be positive and finite")
+            distances.append(float(value))
+        profiles[name] = InstrumentProfile(name, *distances)
+    return MappingProxyType(profiles)
+
+
+class InstrumentRegistry:
+    """
+    Instrument profiles from a TOML file, reloaded when the file changes.
+
+    Parameters:
+        path - TOML file
+        check_interval - minimum time (s) between checks of the file's mtime
+
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        mtime = os.stat(path).st_mtime_ns
+        # (mtime, profiles), replaced as a whole so readers see a consistent pair
+        self._snapshot = (mtime, load_profiles(path))
+        self._next_check = time.monotonic() + check_interval
+        self.reloads = 0
+
+    @property
+    def profiles(self):
+        """
+        Read-only mapping of {name: InstrumentProfile}.
+        """
+        if time.monotonic() >= self._next_check:
+            self._maybe_reload()
+        return self._snapshot[1]
+
+    def _maybe_reload(self):
+        # only one thread reloads, everyone else carries on with the current
+        # snapshot.
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime != self._snapshot[0]:
+                try:
+                    profiles = load_profiles(self.path)
+                except Exception:
+                    # keep the old profiles, and don't try again until the
+                    # file changes
+                    logger.exception("could not reload %s", self.path)
+                    profiles = self._snapshot[1]
+                else:
+                    self.reloads += 1
+                self._snapshot = (mtime, profiles)
+        except OSError:
+            logger.exception("could not stat %s", self.path)
+        finally:
+            self._reload_lock.release()
+
+    def __getitem__(self, name):
+        return self.profiles[name]
+
+    def __contains__(self, name):
+        return name in self.profiles
+
+    def names(self):
+        return list(self.profiles)
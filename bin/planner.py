@@ -0,0 +1,294 @@
+#!/usr/bin/python
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import instruments, slitoptimiser, utils
+
+"""
+Beamtime planner.
+
+Streams a schedule of samples from a CSV or JSONL file (or stdin) and writes
+slit settings, footprints, beam heights and Q ranges for every angle of every
+sample, row by row. Chunks of the schedule are calculated in a process pool,
+with a bounded number of chunks in flight, so large schedules run in bounded
+memory across all cores.
+
+Each sample has an instrument, footprint (mm), resolution (dtheta/theta) and a
+list of angles (degrees). In CSV files the angles are separated by spaces or
+semicolons, e.g.
+
+    name,instrument,footprint,resolution,angles
+    sample1,Platypus,50,0.033,0.8 3.5 6
+
+Samples are checked as they are read, a bad sample stops the run with an
+error giving its line number in the input.
+
+Usage:
+    python -m bin.planner schedule.csv -o plan.csv
+    cat schedule.jsonl | python -m bin.planner --format jsonl
+"""
+
+OUTPUT_FIELDS = (
+    "name",
+    "instrument",
+    "footprint",
+    "resolution",
+    "angle",
+    "d1",
+    "d2",
+    "footprint_umbra",
+    "footprint_penumbra",
+    "height_at_S4",
+    "height_at_detector",
+    "preS1slit",
+    "dtheta",
+    "qmin",
+    "qmax",
+)
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.toml")
+
+
+def read_samples(f, fmt, instrument_names=None):
+    """
+    Generator of sample dicts from a CSV or JSONL file.
+
+    Each sample is checked as it is read, and a ValueError giving the line
+    number of the input is raised for a bad sample, rather than failing later
+    inside a worker process.
+
+    f - file of samples
+    fmt - "csv" or "jsonl"
+    instrument_names - the known instruments, default: any instrument
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield _sample(row, reader.line_num, instrument_names)
+    else:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"line {line_num}: invalid JSON, {e}") from None
+            yield _sample(row, line_num, instrument_names)
+
+
+def _sample(row, line_num, instrument_names):
+    """
+    Validated sample dict from a row of the input, with numeric fields as
+    floats and the angles as a list of floats.
+    """
+    if not isinstance(row, dict):
+        raise ValueError(f"line {line_num}: a sample must be an object")
+    instrument = row.get("instrument") or "Platypus"
+    if instrument_names is not None and instrument not in instrument_names:
+        raise ValueError(f"line {line_num}: unknown instrument {instrument!r}")
+
+    sample = {"name": str(row.get("name") or ""), "instrument": instrument}
+    for field in ("footprint", "resolution"):
+        try:
+            sample[field] = float(row[field])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(
+                f"line {line_num}: {field} must be a number, not {row.get(field)!r}"
+            ) from None
+        if not 0 < sample[field] < np.inf:
+            raise ValueError(f"line {line_num}: {field} must be positive")
+
+    angles = row.get("angles")
+    if isinstance(angles, str):
+        angles = angles.replace(";", " ").split()
+    try:
+        sample["angles"] = [float(angle) for angle in angles]
+    except (TypeError, ValueError):
+        raise ValueError(
+            f"line {line_num}: angles must be a list of numbers, not {angles!r}"
+        ) from None
+    if not all(0 < angle < 90 for angle in sample["angles"]):
+        raise ValueError(f"line {line_num}: angles must be in (0, 90) degrees")
+    return sample
+
+
+def plan_chunk(samples, distances, lambdamin, lambdamax, LSD):
+    """
+    Calculate the plan for a chunk of samples, vectorised over every
+    (sample, angle) in the chunk.
+
+    samples - list of sample dicts
+    distances - {instrument: {"L12": ..., "L2S": ..., "LS4": ..., "LpreS1": ...}}
+    lambdamin, lambdamax - wavelength range (Angstrom)
+    LSD - sample-detector distance (mm)
+
+    Returns:
+        list of output rows (dicts)
+    """
+    rows = []
+    for i, sample in enumerate(samples):
+        instrument = sample.get("instrument", "Platypus")
+        d = distances[instrument]
+        for angle in sample["angles"]:
+            rows.append(
+                (
+                    float(sample["footprint"]),
+                    float(sample["resolution"]),
+                    float(angle),
+                    d["L12"],
+                    d["L2S"],
+                    d["LS4"],
+                    d["LpreS1"],
+                    i,
+                )
+            )
+    if not rows:
+        return []
+
+    footprint, resolution, angle, L12, L2S, LS4, LpreS1, index = np.array(rows).T
+    for L12_, L2S_ in set(zip(L12.tolist(), L2S.tolist())):
+        slitoptimiser.build_slit_table(L12_, L2S_)
+
+    d1, d2 = slitoptimiser.slitoptimiser_batch(
+        footprint, resolution, angle, L12=L12, L2S=L2S, method="table"
+    )
+    umbra, penumbra = slitoptimiser.actual_footprint(d1, d2, L12, L2S, angle)
+    columns = {
+        "footprint": footprint,
+        "resolution": resolution,
+        "angle": angle,
+        "d1": d1,
+        "d2": d2,
+        "footprint_umbra": umbra,
+        "footprint_penumbra": penumbra,
+        "height_at_S4": slitoptimiser.height_of_beam_after_dx(
+            d1, d2, L12, L2S + LS4
+        )[1],
+        "height_at_detector": slitoptimiser.height_of_beam_after_dx(
+            d1, d2, L12, L2S + LSD
+        )[1],
+        "preS1slit": slitoptimiser.height_of_beam_after_dx(d1, d2, L12, -LpreS1)[1],
+        "dtheta": utils.div(d1, d2, L12)[0],
+        "qmin": utils.qcalc(angle, lambdamax),
+        "qmax": utils.qcalc(angle, lambdamin),
+    }
+    columns = {k: v.tolist() for k, v in columns.items()}
+
+    out = []
+    for j, i in enumerate(index.astype(int).tolist()):
+        sample = samples[i]
+        row = {
+            "name": sample.get("name", ""),
+            "instrument": sample.get("instrument", "Platypus"),
+        }
+        row.update({k: v[j] for k, v in columns.items()})
+        out.append(row)
+    return out
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def plan(
+    samples,
+    distances,
+    lambdamin=2.8,
+    lambdamax=18.5,
+    LSD=2500,
+    workers=None,
+    chunk_size=1000,
+):
+    """
+    Generator of output rows for a stream of samples, calculated in a process
+    pool. Output order follows the input order. At most 2 * workers chunks are
+    held in memory at once.
+    """
+    args = (distances, lambdamin, lambdamax, LSD)
+    if workers == 1:
+        for chunk in _chunks(samples, chunk_size):
+            yield from plan_chunk(chunk, *args)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        max_pending = 2 * workers
+        pending = deque()
+        for chunk in _chunks(samples, chunk_size):
+            pending.append(executor.submit(plan_chunk, chunk, *args))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m bin.planner", description="Stream a beamtime plan."
+    )
+    parser.add_argument(
+        "input", nargs="?", default="-", help="schedule (default stdin)"
+    )
+    parser.add_argument("-o", "--output", default="-", help="plan (default stdout)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format")
+    parser.add_argument(
+        "--output-format", choices=("csv", "jsonl"), help="default: input format"
+    )
+    parser.add_argument("--config", default=CONFIG, help="instrument config.toml")
+    parser.add_argument("--lambdamin", type=float, default=2.8)
+    parser.add_argument("--lambdamax", type=float, default=18.5)
+    parser.add_argument("--LSD", type=float, default=2500, help="sample-detector (mm)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        fmt = "jsonl" if args.input.endswith((".jsonl", ".json")) else "csv"
+    output_format = args.output_format or fmt
+
+    distances = {
+        name: profile.distances()
+        for name, profile in instruments.load_profiles(args.config).items()
+    }
+
+    fin = sys.stdin if args.input == "-" else open(args.input, newline="")
+    fout = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        rows = plan(
+            read_samples(fin, fmt, distances),
+            distances,
+            lambdamin=args.lambdamin,
+            lambdamax=args.lambdamax,
+            LSD=args.LSD,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+        )
+        if output_format == "csv":
+            writer = csv.DictWriter(fout, fieldnames=OUTPUT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                fout.write(json.dumps(row) + "\n")
+    except ValueError as e:
+        parser.exit(1, f"{parser.prog}: error: {e}\n")
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import hashlib
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import cache, utils
+
+"""
+Map detector images (pixel x TOF bin) to (Qx, Qy, Qz) for off-specular work.
+
+The maps can be tens of millions of points, so they're calculated in chunks of
+detector rows and can be written straight into memory-mapped .npy files.
+Maps are cached per (geometry, omega, wavelengths) so that repeat frames reuse
+them.
+"""
+
+
+@dataclass(frozen=True)
+class DetectorGeometry:
+    """
+    Geometry of an area detector.
+
+    distance - sample-detector distance (mm)
+    shape - (ny, nx) number of pixels. y is vertical (out of the sample
+        plane), x is horizontal (in the sample plane)
+    pixel_size - (y, x) size of a pixel (mm)
+    centre - (y, x) pixel position of the direct (unreflected) beam
+    """
+
+    distance: float
+    shape: tuple
+    pixel_size: tuple
+    centre: tuple
+
+    def angles(self):
+        """
+        Angles of every pixel, relative to the direct beam.
+
+        Returns:
+            (twotheta, phi) in degrees, of shape (ny, 1) and (1, nx).
+        """
+        ny, nx = self.shape
+        dy = (np.arange(ny) - self.centre[0]) * self.pixel_size[0]
+        dx = (np.arange(nx) - self.centre[1]) * self.pixel_size[1]
+        twotheta = np.degrees(np.arctan2(dy, self.distance))[:, None]
+        phi = np.degrees(np.arctan2(dx, self.distance))[None, :]
+        return twotheta, phi
+
+
+def qmap(
+    geometry, omega, wavelengths, chunk_rows=64, directory=None, dtype=np.float32
+):
+    """
+    (Qx, Qy, Qz) of every (pixel, TOF bin) of a detector image.
+
+    geometry - `DetectorGeometry`
+    omega - angle of incidence (degrees)
+    wavelengths - wavelength of each TOF bin (Angstrom), shape (nt,)
+    chunk_rows - number of detector rows calculated at a time, which bounds
+        the temporary memory used
+    directory - if given, the maps are written to qx.npy, qy.npy and qz.npy
+        in this directory as memory-mapped arrays
+    dtype - dtype of the maps
+
+    Returns:
+        (qx, qy, qz) arrays of shape (ny, nx, nt)
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    ny, nx = geometry.shape
+    shape = (ny, nx, wavelengths.size)
+
+    if directory is None:
+        out = tuple(np.empty(shape, dtype=dtype) for _ in range(3))
+    else:
+        os.makedirs(directory, exist_ok=True)
+        out = tuple(
+            np.lib.format.open_memmap(
+                os.path.join(directory, f"{name}.npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=shape,
+            )
+            for name in ("qx", "qy", "qz")
+        )
+
+    twotheta, phi = geometry.angles()
+    for start in range(0, ny, chunk_rows):
+        rows = slice(start, min(start + chunk_rows, ny))
+        q = utils.qcalc2(
+            omega,
+            twotheta[rows, :, None],
+            phi[:, :, None],
+            wavelengths[None, None, :],
+        )
+        for o, component in zip(out, q):
+            o[rows] = component
+
+    for o in out:
+        if isinstance(o, np.memmap):
+            o.flush()
+    return out
+
+
+# maps are large, so only keep a few
+map_cache = cache.LRUCache(int(os.environ.get("REFCALC_QMAP_CACHE_SIZE", 4)))
+
+
+def cached_qmap(geometry, omega, wavelengths, dtype=np.float32, chunk_rows=64):
+    """
+    `qmap`, held in memory and cached on (geometry, omega, wavelengths,
+    dtype). `chunk_rows` only affects how the map is calculated, not the
+    result, so it isn't part of the key. Maps written to a directory aren't
+    cached, use `qmap` for those.
+    """
+    wavelengths = np.ascontiguousarray(wavelengths, dtype=float)
+    digest = hashlib.sha1(wavelengths.tobytes()).hexdigest()
+    key = (geometry, cache.quantise(omega), digest, np.dtype(dtype).str)
+    return map_cache.get_or_compute(
+        key, qmap, geometry, omega, wavelengths, chunk_rows=chunk_rows, dtype=dtype
+    )
@@ -0,0 +1,145 @@
+import numpy as np
+
+from . import utils
+
+"""
+Time-of-flight Q resolution.
+
+For a TOF reflectometer the resolution of each wavelength bin combines the
+angular term, from the collimation (`utils.div`), with a wavelength term from
+the chopper burst time and the width of the TOF bin:
+
+    (dQ/Q)^2 = (dtheta/theta)^2 + (dlambda/lambda)^2
+
+All values are FWHM.
+"""
+
+# h / m_n, (m/s) * Angstrom
+H_OVER_MN = 3956.034
+
+# upper limit on the number of bins in a wavelength or Q grid
+MAX_BINS = 100000
+
+
+def _nbins(lo, hi, fractional_width, max_bins):
+    """
+    Number of bins of constant fractional width needed to span [lo, hi],
+    checked before anything is allocated.
+    """
+    if not (0 < lo < hi < np.inf):
+        raise ValueError("need 0 < min < max")
+    if not 0 < fractional_width < np.inf:
+        raise ValueError("bin width must be positive")
+    nbins = np.ceil(np.log(hi / lo) / np.log1p(fractional_width))
+    if not nbins <= max_bins:
+        raise ValueError(f"too many bins, the limit is {max_bins}")
+    return int(nbins)
+
+
+def wavelength_bins(lambdamin, lambdamax, dlambda=0.01, max_bins=MAX_BINS):
+    """
+    Wavelength bins of constant fractional width, as used on Platypus/Spatz.
+
+    lambdamin, lambdamax - wavelength range (Angstrom)
+    dlambda - fractional bin width, dlambda/lambda
+    max_bins - ValueError is raised if more bins than this are needed
+
+    Returns:
+        (centres, edges)
+    """
+    nbins = _nbins(lambdamin, lambdamax, dlambda, max_bins)
+    edges = lambdamin * np.power(1 + dlambda, np.arange(nbins + 1))
+    return np.sqrt(edges[1:] * edges[:-1]), edges
+
+
+def chopper_resolution(wavelengths, frequency, opening, flight_length, bin_width=0):
+    """
+    Fractional wavelength resolution (FWHM) from a chopper.
+
+    wavelengths - wavelengths (Angstrom)
+    frequency - chopper frequency (Hz)
+    opening - angular opening of the chopper window (degrees), i.e. the
+        burst time is opening / 360 / frequency
+    flight_length - distance from the chopper to the detector (mm)
+    bin_width - fractional width of the TOF bins, added in quadrature
+
+    Returns:
+        dlambda/lambda for each wavelength
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    burst_time = opening / 360.0 / frequency
+    flight_time = flight_length / 1000.0 * wavelengths / H_OVER_MN
+    return np.sqrt(np.power(burst_time / flight_time, 2) + np.power(bin_width, 2))
+
+
+def tof_resolution(angles, wavelengths, d1, d2, L12, dlambda):
+    """
+    Q and dQ (FWHM) for every (angle, wavelength bin), in one broadcast pass.
+
+    angles - angles of incidence (degrees), shape (N,)
+    wavelengths - wavelength bin centres (Angstrom), shape (M,)
+    d1, d2 - slit openings for each angle (mm), shape (N,) or scalar
+    L12 - distance between the collimation slits (mm)
+    dlambda - fractional wavelength resolution, scalar or shape (M,) (or
+        anything broadcastable to (N, M))
+
+    Returns:
+        (Q, dQ) arrays of shape (N, M)
+    """
+    angles = np.atleast_1d(np.asarray(angles, dtype=float))[:, None]
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))[None, :]
+    d1 = np.atleast_1d(np.asarray(d1, dtype=float))[:, None]
+    d2 = np.atleast_1d(np.asarray(d2, dtype=float))[:, None]
+
+    dtheta = utils.div(d1, d2, L12)[0]
+    dq_q = np.sqrt(np.power(dtheta / angles, 2) + np.power(dlambda, 2))
+
+    Q = utils.qcalc(angles, wavelengths)
+    return Q, Q * dq_q
+
+
+def constant_resolution_grid(qmin, qmax, resolution, max_bins=MAX_BINS):
+    """
+    Q bin edges with a constant fractional width, dQ/Q = resolution.
+    ValueError is raised if more than `max_bins` bins are needed.
+    """
+    nbins = _nbins(qmin, qmax, resolution, max_bins)
+    return qmin * np.power(1 + resolution, np.arange(nbins + 1))
+
+
+def rebin(Q, dQ, edges, weights=None):
+    """
+    Rebin (Q, dQ) of each angle onto a common grid, e.g. from
+    `constant_resolution_grid`. Done for all angles at once with `np.bincount`.
+
+    Q, dQ - arrays of shape (N, M), from `tof_resolution`
+    edges - Q bin edges, shape (K + 1,)
+    weights - optional weights of each point (e.g. the incident spectrum),
+        shape broadcastable to (N, M)
+
+    Returns:
+        (Q, dQ, counts) of shape (N, K): the weighted mean Q and dQ of the
+        points falling in each bin (NaN if empty), and the number of points.
+    """
+    Q = np.atleast_2d(Q)
+    dQ = np.atleast_2d(dQ)
+    weights = np.broadcast_to(1.0 if weights is None else weights, Q.shape)
+    nangles = Q.shape[0]
+    nbins = edges.size - 1
+
+    idx = np.digitize(Q, edges) - 1
+    valid = (idx >= 0) & (idx < nbins)
+    # offset the bin index of each angle so one bincount does them all
+    flat = (idx + nbins * np.arange(nangles)[:, None])[valid]
+    size = nangles * nbins
+
+    w = np.bincount(flat, weights[valid], minlength=size)
+    q = np.bincount(flat, (weights * Q)[valid], minlength=size)
+    dq = np.bincount(flat, (weights * dQ)[valid], minlength=size)
+    counts = np.bincount(flat, minlength=size)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        q = np.where(w > 0, q / w, np.nan)
+        dq = np.where(w > 0, dq / w, np.nan)
+    shape = (nangles, nbins)
+    return q.reshape(shape), dq.reshape(shape), counts.reshape(shape)
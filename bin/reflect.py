@@ -0,0 +1,195 @@
+import numpy as np
+
+from . import qresolution, utils
+
+"""
+Specular reflectivity of a layered sample and the counting time needed to
+measure it.
+
+The layer model is an array of shape (N + 2, 4), the rows run from the
+fronting medium to the backing medium and the columns are
+
+    thickness (A), SLD (10^-6 A^-2), iSLD (10^-6 A^-2), roughness (A)
+
+The thickness of the first and last rows are ignored, the roughness of a row
+is that of the interface above it.
+"""
+
+# FWHM of a Gaussian in units of its standard deviation
+_FWHM = 2 * np.sqrt(2 * np.log(2))
+
+# Gauss-Legendre quadrature for the resolution kernel, cached by
+# (order, extent)
+_kernels = {}
+
+
+def abeles(q, layers):
+    """
+    Unsmeared reflectivity, from the Abeles characteristic matrix method.
+
+    q - Q values (A^-1), any shape
+    layers - layer model, shape (N + 2, 4)
+
+    Returns:
+        reflectivity, same shape as q
+
+    The wavevectors, Fresnel coefficients and phase factors are calculated
+    for every (Q, layer) at once. Only the product of the layer matrices is
+    sequential, and each step of it is vectorised over Q.
+    """
+    q = np.asarray(q, dtype=float)
+    layers = np.asarray(layers, dtype=float)
+    if layers.ndim != 2 or layers.shape[0] < 2 or layers.shape[1] != 4:
+        raise ValueError("layers should have shape (N + 2, 4)")
+
+    kz = q.reshape(-1, 1) / 2.0
+
+    # wavevector in each layer, relative to the fronting medium
+    sld = (layers[:, 1] + 1j * np.abs(layers[:, 2])) * 1e-6
+    sld = sld - sld[0].real
+    kn = np.sqrt(kz * kz - 4 * np.pi * sld + 0j)
+
+    # Fresnel coefficients of each interface, with Nevot-Croce roughness
+    k0, k1 = kn[:, :-1], kn[:, 1:]
+    rj = (k0 - k1) / (k0 + k1) * np.exp(-2 * k0 * k1 * layers[1:, 3] ** 2)
+
+    # phase factor of the layer above each interface, 0 for the fronting
+    beta = 1j * kn[:, :-1] * layers[:-1, 0]
+    beta[:, 0] = 0
+    eb, emb = np.exp(beta), np.exp(-beta)
+
+    m00, m01 = eb[:, 0], rj[:, 0] * eb[:, 0]
+    m10, m11 = rj[:, 0] * emb[:, 0], emb[:, 0]
+    for j in range(1, rj.shape[1]):
+        p00, p01 = eb[:, j], rj[:, j] * eb[:, j]
+        p10, p11 = rj[:, j] * emb[:, j], emb[:, j]
+        m00, m01, m10, m11 = (
+            m00 * p00 + m01 * p10,
+            m00 * p01 + m01 * p11,
+            m10 * p00 + m11 * p10,
+            m10 * p01 + m11 * p11,
+        )
+
+    r = m10 / m00
+    return (r * np.conj(r)).real.reshape(q.shape)
+
+
+def gauss_kernel(order=17, extent=3.5):
+    """
+    Quadrature points and weights of a unit Gaussian resolution kernel.
+
+    order - number of Gauss-Legendre points
+    extent - the kernel is integrated over +/- extent standard deviations
+
+    Returns:
+        (x, w), where x is in units of the standard deviation and w sums to 1
+    """
+    key = (order, extent)
+    if key not in _kernels:
+        x, w = np.polynomial.legendre.leggauss(order)
+        x = x * extent
+        w = w * np.exp(-0.5 * x * x)
+        _kernels[key] = (x, w / w.sum())
+    return _kernels[key]
+
+
+def reflectivity(q, layers, dq=None, order=17):
+    """
+    Reflectivity smeared by a Gaussian resolution kernel.
+
+    q - Q values (A^-1), any shape
+    layers - layer model, shape (N + 2, 4)
+    dq - FWHM resolution of each Q value (A^-1), broadcastable to q. No
+        smearing if None.
+    order - number of quadrature points in the resolution kernel
+
+    Returns:
+        reflectivity, same shape as q
+    """
+    q = np.asarray(q, dtype=float)
+    if dq is None:
+        return abeles(q, layers)
+
+    x, w = gauss_kernel(order)
+    sigma = np.broadcast_to(dq, q.shape) / _FWHM
+    qq = np.abs(q[..., None] + sigma[..., None] * x)
+    return abeles(qq, layers) @ w
+
+
+def count_rates(
+    layers,
+    angles,
+    d1,
+    d2,
+    L12=2859.5,
+    lambdamin=2.8,
+    lambdamax=18.0,
+    dlambda=0.033,
+    incident=1e5,
+    order=17,
+):
+    """
+    Reflectivity and count rate in each TOF bin of a set of angles.
+
+    layers - layer model, shape (N + 2, 4)
+    angles - angles of incidence (degrees), shape (A,)
+    d1, d2 - slit openings for each angle (mm), shape (A,)
+    L12 - distance between the collimation slits (mm)
+    lambdamin, lambdamax - wavelength band (Angstrom)
+    dlambda - width of the wavelength bins, and wavelength resolution,
+        dlambda/lambda
+    incident - incident neutrons/s in each wavelength bin through slits with
+        d1 * d2 / L12 = 1 mm. Scalar, or one value per wavelength bin.
+    order - number of quadrature points in the resolution kernel
+
+    Returns:
+        dict of arrays with shape (A, M), "Q", "dQ", "R" and "rate"
+        (counts/s), with "wavelength" of shape (M,)
+    """
+    wavelengths, _ = qresolution.wavelength_bins(lambdamin, lambdamax, dlambda)
+    d1 = np.broadcast_to(np.asarray(d1, dtype=float), np.shape(angles))
+    d2 = np.broadcast_to(np.asarray(d2, dtype=float), np.shape(angles))
+    Q, dQ = qresolution.tof_resolution(angles, wavelengths, d1, d2, L12, dlambda)
+
+    R = reflectivity(Q, layers, dQ, order=order)
+    transmission = (d1 * d2 / L12)[:, None]
+    rate = R * np.asarray(incident, dtype=float) * transmission
+    return {"wavelength": wavelengths, "Q": Q, "dQ": dQ, "R": R, "rate": rate}
+
+
+def counting_time(rate, precision=0.05, qmax_fraction=1.0, Q=None):
+    """
+    Time needed for each angle to reach a given statistical precision.
+
+    rate - count rate in each bin, shape (A, M), from `count_rates`
+    precision - target relative uncertainty in a bin, 1 / sqrt(counts)
+    qmax_fraction, Q - if Q is given, only bins with Q below
+        qmax_fraction * max(Q) of each angle need reach the precision. This
+        stops the short wavelength tail from setting the time of an angle.
+
+    Returns:
+        (time, counts): the counting time of each angle (s), shape (A,), and
+        the counts expected in each bin in that time, shape (A, M). The time
+        is inf if a bin that counts towards it has no intensity.
+    """
+    if not precision > 0:
+        raise ValueError("precision must be positive")
+    rate = np.asarray(rate, dtype=float)
+    needed = 1.0 / precision**2
+    considered = rate
+    if Q is not None:
+        limit = qmax_fraction * np.max(Q, axis=1, keepdims=True)
+        considered = np.where(Q <= limit, rate, np.inf)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        time = needed / np.min(considered, axis=1)
+        counts = rate * time[:, None]
+    return time, counts
+
+
+def critical_edge(layers):
+    """
+    Critical Q of the backing medium, relative to the fronting medium.
+    """
+    layers = np.asarray(layers, dtype=float)
+    return utils.qcrit(layers[0, 1], max(layers[-1, 1], layers[0, 1]))
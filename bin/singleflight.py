@@ -0,0 +1,102 @@
+import threading
+
+"""
+Request coalescing ("single flight").
+
+When several threads ask for the same result at the same time, only the
+first does the work. The others wait for it to finish and share its result
+(or its exception).
+"""
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Group:
+    """
+    Coalesces concurrent calls that share a key.
+
+    Attributes:
+        calls - calls that did the work
+        coalesced - calls that waited for, and shared, the result of another
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwds):
+        """
+        Returns `func(*args, **kwds)`. If a call with the same key is already
+        in flight the result of that call is returned instead.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = func(*args, **kwds)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def stats(self):
+        """
+        Returns a dict of the counters.
+        """
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+            }
+
+
+def cached(cache, group, key, func, *args, **kwds):
+    """
+    Like `cache.get_or_compute(key, func, *args, **kwds)`, but concurrent
+    misses for the same key are coalesced by `group`. The result is stored
+    before the call leaves the group, so later callers find it in the cache.
+    """
+    value = cache.get(key, _missing)
+    if value is _missing:
+        value = group.do(key, _compute, cache, key, func, *args, **kwds)
+    return value
+
+
+def _compute(cache, key, func, *args, **kwds):
+    # another call may have finished between the cache miss and joining the
+    # group
+    value = cache.get(key, _missing) if key in cache else _missing
+    if value is _missing:
+        value = func(*args, **kwds)
+        cache.put(key, value)
+    return value
+
+
+_missing = object()
@@ -0,0 +1,177 @@
+import os
+
+import numpy as np
+
+from . import cache, singleflight, startup
+
+"""
+Neutron and X-ray scattering length density calculations, backed by
+periodictable.
+
+Parsing formulae and calculating SLDs is slow compared to a dictionary lookup,
+and the same compounds are requested over and over, so both are cached.
+"""
+
+# periodictable builds all its element/isotope tables when it's imported.
+# Defer that until it's first used.
+periodictable = startup.LazyModule("periodictable")
+
+# parsed formulae, keyed on the formula string
+formula_cache = cache.LRUCache(int(os.environ.get("REFCALC_FORMULA_CACHE_SIZE", 512)))
+
+# SLDs, keyed on (kind, formula, density, wavelength or energy)
+sld_cache = cache.LRUCache(int(os.environ.get("REFCALC_SLD_CACHE_SIZE", 4096)))
+
+# concurrent requests for the same formula or SLD share one calculation
+formula_flight = singleflight.Group()
+sld_flight = singleflight.Group()
+
+
+def formula(compound):
+    """
+    Parse a chemical formula with `periodictable.formula`, memoised on the
+    formula string.
+    """
+    return singleflight.cached(
+        formula_cache, formula_flight, compound, _formula, compound
+    )
+
+
+def _formula(compound):
+    return periodictable.load().formula(compound)
+
+
+def neutron_sld(compound, density, wavelength):
+    """
+    Neutron SLD (10^-6 A^-2) of a compound.
+
+    compound - formula string
+    density - mass density (g/cm^3)
+    wavelength - neutron wavelength (Angstrom)
+
+    Returns:
+        complex SLD, real + imag * 1j
+    """
+    key = ("neutron", compound) + cache.quantise(density, wavelength)
+    return singleflight.cached(
+        sld_cache, sld_flight, key, _neutron_sld, compound, density, wavelength
+    )
+
+
+def xray_sld(compound, density, energy):
+    """
+    X-ray SLD (10^-6 A^-2) of a compound.
+
+    compound - formula string
+    density - mass density (g/cm^3)
+    energy - X-ray energy (keV)
+
+    Returns:
+        complex SLD, real + imag * 1j
+    """
+    key = ("xray", compound) + cache.quantise(density, energy)
+    return singleflight.cached(
+        sld_cache, sld_flight, key, _xray_sld, compound, density, energy
+    )
+
+
+def _neutron_sld(compound, density, wavelength):
+    real, imag, mu = periodictable.load().neutron_sld(
+        formula(compound), density=density, wavelength=wavelength
+    )
+    return real + imag * 1j
+
+
+def _xray_sld(compound, density, energy):
+    real, imag = periodictable.load().xray_sld(
+        formula(compound), density=density, energy=energy
+    )
+    return real + imag * 1j
+
+
+def density_from_volume(compound, volume):
+    """
+    Mass density (g/cm^3) of a compound from its molecular volume (A^3).
+    """
+    f = formula(compound)
+    return f.molecular_mass / f.volume(a=volume, b=1, c=1)
+
+
+def volume_from_density(compound, density):
+    """
+    Molecular volume (A^3) of a compound from its mass density (g/cm^3).
+    """
+    pt = periodictable.load()
+    return formula(compound).mass / density / pt.constants.avogadro_number * 1e24
+
+
+def neutron_sld_spectrum(compound, density, wavelengths):
+    """
+    Neutron SLD (10^-6 A^-2) of a compound over a grid of wavelengths.
+
+    The energy dependent scattering lengths of each element are evaluated
+    over the whole grid at once, rather than point by point.
+
+    compound - formula string
+    density - mass density (g/cm^3)
+    wavelengths - array of neutron wavelengths (Angstrom)
+
+    Returns:
+        (real, imag) arrays
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    real, imag, mu = periodictable.load().neutron_sld(
+        formula(compound), density=density, wavelength=wavelengths
+    )
+    return (
+        np.broadcast_to(real, wavelengths.shape),
+        np.broadcast_to(imag, wavelengths.shape),
+    )
+
+
+def xray_sld_spectrum(compound, density, energies):
+    """
+    X-ray SLD (10^-6 A^-2) of a compound over a grid of energies.
+
+    The scattering factors of each element are interpolated over the whole
+    grid at once, rather than point by point.
+
+    compound - formula string
+    density - mass density (g/cm^3)
+    energies - array of X-ray energies (keV)
+
+    Returns:
+        (real, imag) arrays
+    """
+    energies = np.asarray(energies, dtype=float)
+    real, imag = periodictable.load().xray_sld(
+        formula(compound), density=density, energy=energies
+    )
+    return (
+        np.broadcast_to(real, energies.shape),
+        np.broadcast_to(imag, energies.shape),
+    )
+
+
+MAX_GRID_POINTS = 100000
+
+
+def grid(spec):
+    """
+    Make a grid of wavelengths/energies.
+
+    spec - either a sequence of values, or a dict {"min": ..., "max": ...,
+        "n": ...} specifying a linearly spaced grid.
+
+    Returns:
+        1-D array
+    """
+    if isinstance(spec, dict):
+        values = np.linspace(float(spec["min"]), float(spec["max"]), int(spec["n"]))
+    else:
+        values = np.asarray(spec, dtype=float).ravel()
+    if values.size > MAX_GRID_POINTS:
+        raise ValueError(f"grids are limited to {MAX_GRID_POINTS} points")
+    if not np.all(values > 0):
+        raise ValueError("grid values must be positive")
+    return values
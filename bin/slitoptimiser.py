@@ -1,4 +1,5 @@
 #!/usr/bin/python
+import math
 import numpy as np
 from . import fminbound
 import sys
@@ -39,6 +40,11 @@ def height_of_beam_after_dx(d1, d2, L12, distance):
 
     alpha = (d1 + d2) / 2.0 / L12
     beta = abs(d1 - d2) / 2.0 / L12
+    if np.ndim(distance):
+        # array of distances, select the slit each one is measured from.
+        distance = np.asarray(distance)
+        d = np.where(distance >= 0, d2, d1)
+        return (beta * abs(distance) * 2) + d, (alpha * abs(distance) * 2) + d
     if distance >= 0:
         return (beta * distance * 2) + d2, (alpha * distance * 2) + d2
     else:
@@ -62,6 +68,297 @@ def actual_footprint(d1, d2, L12, L2S, angle):
     return umbra / np.radians(angle), penumbra / np.radians(angle)
 
 
+SOLVER_METHODS = ("analytic", "brent", "table")
+
+
+def _d1star(d2star):
+    return np.sqrt(1 - np.power(d2star, 2))
+
+
+def _gseekfun(d2star, L1star, ratio):
+    return np.power((d2star + ratio * (d2star + _d1star(d2star))) - L1star, 2)
+
+
+def _analytic_d2star(L1star, ratio):
+    """
+    Closed form minimiser of `_gseekfun` on [0, 1].
+
+    The objective is zero where (1 + ratio) * d2* + ratio * sqrt(1 - d2*^2)
+    equals L1*. Squaring gives a quadratic in d2*, whose smaller root is
+    the one on the rising side of the curve. Once L1* exceeds the value of
+    the curve at d2* = d1* = 1/sqrt(2) the root is past the equal slit
+    point, so 1 is returned to signal that the slits are to be clamped.
+
+    Parameters:
+        L1star - normalised footprint
+        ratio - L2S / L12
+
+    Returns:
+        (d2star, degenerate)
+        degenerate is True where there is no root in [0, 1] (L1star <= ratio),
+        or the inputs are not finite. Those have to be solved numerically.
+
+    """
+    L1star, ratio = np.broadcast_arrays(
+        np.asarray(L1star, dtype=float), np.asarray(ratio, dtype=float)
+    )
+    degenerate = ~(
+        np.isfinite(L1star) & np.isfinite(ratio) & (ratio >= 0) & (L1star > ratio)
+    )
+    A = np.power(1 + ratio, 2) + np.power(ratio, 2)
+    threshold = (1 + 2 * ratio) / np.sqrt(2)
+    with np.errstate(invalid="ignore"):
+        L = np.minimum(L1star, threshold)
+        d2star = (L * (1 + ratio) - ratio * np.sqrt(A - L * L)) / A
+    d2star = np.where(L1star > threshold, 1.0, d2star)
+    return d2star, degenerate
+
+
+def _analytic_d2star_scalar(L1star, ratio):
+    """
+    `_analytic_d2star` for a single problem in plain floats, which is much
+    quicker than going through numpy. Returns None if the problem is
+    degenerate.
+    """
+    if not (math.isfinite(L1star) and math.isfinite(ratio) and 0 <= ratio < L1star):
+        return None
+    if L1star > (1 + 2 * ratio) / math.sqrt(2):
+        return 1.0
+    A = (1 + ratio) ** 2 + ratio**2
+    return (L1star * (1 + ratio) - ratio * math.sqrt(A - L1star * L1star)) / A
+
+
+def _clamp_dstar(d2star):
+    """
+    Returns (d1star, multfactor, equal) for a minimiser of `_gseekfun`.
+    """
+    optimal_d1star = _d1star(d2star)
+    # you found a minimum, but this may not be the optimum size of the slits.
+    equal = d2star > optimal_d1star
+    with np.errstate(divide="ignore", invalid="ignore"):
+        multfactor = np.where(equal, 1.0, d2star / optimal_d1star)
+    optimal_d1star = np.where(equal, 1 / np.sqrt(2), optimal_d1star)
+    return optimal_d1star, multfactor, equal
+
+
+class SlitTable:
+    """
+    Dense, monotone lookup table of the normalised slit solution, d2* vs L1*,
+    for a single L2S / L12 ratio.
+
+    The table spans the optimal branch, L1* in (ratio, (1 + 2 * ratio) / sqrt(2)].
+    It is refined until the linear interpolation error, checked at the
+    midpoint of every interval against the closed form solution, is below
+    `xtol`.
+
+    Parameters:
+        ratio - L2S / L12
+        xtol - maximum interpolation error in d2*
+        npoints - initial number of points in the table
+
+    """
+
+    def __init__(self, ratio, xtol=1e-5, npoints=129):
+        self.ratio = float(ratio)
+        self.xtol = xtol
+        lo = self.ratio
+        hi = (1 + 2 * self.ratio) / np.sqrt(2)
+
+        while True:
+            L1star = np.linspace(lo, hi, npoints)
+            d2star, _ = _analytic_d2star(L1star, self.ratio)
+            midpoints = 0.5 * (L1star[1:] + L1star[:-1])
+            exact, _ = _analytic_d2star(midpoints, self.ratio)
+            error = np.max(np.abs(np.interp(midpoints, L1star, d2star) - exact))
+            if error < xtol:
+                break
+            npoints = 2 * npoints - 1
+
+        self.L1star = L1star
+        self.d2star = d2star
+        self.error = error
+
+    def __len__(self):
+        return self.L1star.size
+
+    def lookup(self, L1star):
+        """
+        Interpolate d2* from the table.
+
+        Returns:
+            (d2star, outside)
+            outside is True where L1* lies below the table (or isn't finite)
+            and needs to be solved by other means. Above the table the slits
+            are clamped to be equal, which is signalled by d2* = 1.
+
+        """
+        L1star = np.asarray(L1star, dtype=float)
+        outside = ~(np.isfinite(L1star) & (L1star > self.L1star[0]))
+        d2star = np.interp(L1star, self.L1star, self.d2star)
+        d2star = np.where(L1star > self.L1star[-1], 1.0, d2star)
+        return d2star, outside
+
+
+_slit_tables = {}
+
+
+def build_slit_table(L12, L2S, xtol=1e-5):
+    """
+    Build (and register) a `SlitTable` for an instrument geometry. Subsequent
+    calls with `method="table"` for the same L2S / L12 will use it.
+    """
+    ratio = L2S / L12
+    table = _slit_tables.get(ratio)
+    if table is None or table.xtol > xtol:
+        table = _slit_tables[ratio] = SlitTable(ratio, xtol=xtol)
+    return table
+
+
+def get_slit_table(L12, L2S):
+    """
+    Returns the registered `SlitTable` for an instrument geometry, or None.
+    """
+    return _slit_tables.get(L2S / L12)
+
+
+def _initial_d2star(L1star, ratio, method):
+    """
+    Non-iterative estimate of the minimiser of `_gseekfun`, from a lookup
+    table or the closed form solution. Lanes flagged as degenerate have to
+    be solved with the Brent minimiser.
+
+    Returns:
+        (d2star, degenerate, used) arrays, where used is the method used
+        for each lane.
+    """
+    L1star, ratio = np.broadcast_arrays(
+        np.asarray(L1star, dtype=float), np.asarray(ratio, dtype=float)
+    )
+    d2star = np.zeros(L1star.shape)
+    degenerate = np.ones(L1star.shape, dtype=bool)
+    used = np.full(L1star.shape, "brent", dtype="<U8")
+    if method == "brent":
+        return d2star, degenerate, used
+
+    # custom geometries without a table are solved analytically.
+    analytic = np.ones(L1star.shape, dtype=bool)
+    if method == "table":
+        for r in np.unique(ratio):
+            table = _slit_tables.get(float(r))
+            if table is None:
+                continue
+            lanes = ratio == r
+            d2star[lanes], degenerate[lanes] = table.lookup(L1star[lanes])
+            used[lanes & ~degenerate] = "table"
+            analytic[lanes] = False
+
+    d2star[analytic], degenerate[analytic] = _analytic_d2star(
+        L1star[analytic], ratio[analytic]
+    )
+    used[analytic & ~degenerate] = "analytic"
+    return d2star, degenerate, used
+
+
+def _optimal_dstar(L1star, ratio, method="analytic"):
+    """
+    Solve the normalised slit problem.
+
+    Parameters:
+        L1star - normalised footprint, 0.68 * footprint / L12 / resolution
+        ratio - L2S / L12
+        method - "analytic" uses the closed form solution, falling back to
+            "brent" (bounded minimisation) in degenerate cases. "table"
+            interpolates from a registered `SlitTable`, or is the same as
+            "analytic" if there isn't a table for this ratio.
+
+    Returns:
+        (d1star, multfactor, info), where d2 = d1 * multfactor.
+        info is a `fminbound.Result` holding the `branch` ("optimal" or
+        "equal"), the `method` actually used, `nfev`, `nit` and `status`.
+
+    """
+    if method not in SOLVER_METHODS:
+        raise ValueError(f"method must be one of {SOLVER_METHODS}")
+
+    if (
+        isinstance(L1star, float)
+        and isinstance(ratio, float)
+        and (method == "analytic" or (method == "table" and ratio not in _slit_tables))
+    ):
+        d2star = _analytic_d2star_scalar(L1star, ratio)
+        if d2star is not None:
+            info = fminbound.Result(method="analytic", nfev=0, nit=0, status=0)
+            d1star = math.sqrt(1 - d2star * d2star)
+            if d2star > d1star:
+                info["branch"] = "equal"
+                return 1 / math.sqrt(2), 1.0, info
+            info["branch"] = "optimal"
+            return d1star, d2star / d1star, info
+
+    d2star, degenerate, used = _initial_d2star(L1star, ratio, method)
+    info = fminbound.Result(method=str(used), nfev=0, nit=0, status=0)
+
+    if degenerate:
+        res = fminbound._minimize_scalar_bounded(
+            _gseekfun, (0, 1), args=(L1star, ratio)
+        )
+        d2star = res.x
+        info.update(nfev=res.nfev, nit=res.nit, status=res.status)
+
+    optimal_d1star, multfactor, equal = _clamp_dstar(d2star)
+    info["branch"] = "equal" if equal else "optimal"
+    return float(optimal_d1star), float(multfactor), info
+
+
+def _optimal_dstar_batch(L1star, ratio, method="analytic"):
+    """
+    Vectorised version of `_optimal_dstar`. Any problem that can't be solved
+    analytically is solved with a single batched Brent minimisation.
+
+    Parameters:
+        L1star - array of normalised footprints
+        ratio - array of L2S / L12
+        method - "analytic", "brent" or "table"
+
+    Returns:
+        (d1star, multfactor, info) arrays, info holding arrays of `branch`,
+        `method`, `nfev`, `nit` and `status`.
+
+    """
+    if method not in SOLVER_METHODS:
+        raise ValueError(f"method must be one of {SOLVER_METHODS}")
+
+    L1star, ratio = np.broadcast_arrays(
+        np.asarray(L1star, dtype=float), np.asarray(ratio, dtype=float)
+    )
+    nfev = np.zeros(L1star.shape, dtype=int)
+    nit = np.zeros(L1star.shape, dtype=int)
+    status = np.zeros(L1star.shape, dtype=int)
+
+    d2star, degenerate, used = _initial_d2star(L1star, ratio, method)
+
+    if np.any(degenerate):
+        res = fminbound._minimize_scalar_bounded_batch(
+            _gseekfun,
+            (np.zeros(np.count_nonzero(degenerate)), 1),
+            args=(L1star[degenerate], ratio[degenerate]),
+        )
+        d2star[degenerate] = res.x
+        nfev[degenerate] = res.nfev
+        nit[degenerate] = res.nit
+        status[degenerate] = res.status
+
+    optimal_d1star, multfactor, equal = _clamp_dstar(d2star)
+    info = fminbound.Result(
+        branch=np.where(equal, "equal", "optimal"),
+        method=used,
+        nfev=nfev,
+        nit=nit,
+        status=status,
+    )
+    return optimal_d1star, multfactor, info
+
+
 def slitoptimiser(
     footprint,
     resolution,
@@ -71,6 +368,8 @@ def slitoptimiser(
     LS4=290.5,
     LSD=2500,
     verbose=True,
+    method="analytic",
+    full_output=False,
 ):
     """
     Optimise slit settings for a given angular resolution, and a given footprint.
@@ -78,6 +377,13 @@ def slitoptimiser(
     footprint - maximum footprint onto sample (mm)
     resolution - fractional dtheta/theta resolution (FWHM)
     angle      - optional, angle of incidence in degrees
+    method     - optional, "analytic" (closed form, default), "brent"
+                 (bounded minimisation) or "table" (interpolate from a table
+                 built with `build_slit_table`)
+    full_output - optional, if True also return a `fminbound.Result` with
+                 the solver `branch` ("optimal", or "equal" if the slits were
+                 clamped to be the same size), `method`, `nfev`, `nit` and
+                 `status`.
 
     #slit1-slit2 distance (mm)
     L12 = 2859.5
@@ -96,24 +402,8 @@ def slitoptimiser(
         print("fractional angular resolution (FWHM):", resolution)
         print("theta:", angle, "degrees")
 
-    d1star = lambda d2star: np.sqrt(1 - np.power(d2star, 2))
     L1star = 0.68 * footprint / L12 / resolution
-
-    gseekfun = lambda d2star: np.power(
-        (d2star + L2S / L12 * (d2star + d1star(d2star))) - L1star, 2
-    )
-
-    res = fminbound.fminbound(gseekfun, 0, 1)
-
-    optimal_d2star = res
-    optimal_d1star = d1star(optimal_d2star)
-    if optimal_d2star > optimal_d1star:
-        # you found a minimum, but this may not be the optimum size of the slits.
-        multfactor = 1
-        optimal_d2star = 1 / np.sqrt(2)
-        optimal_d1star = 1 / np.sqrt(2)
-    else:
-        multfactor = optimal_d2star / optimal_d1star
+    optimal_d1star, multfactor, info = _optimal_dstar(L1star, L2S / L12, method=method)
 
     d1 = optimal_d1star * resolution / 0.68 * np.radians(angle) * L12
     d2 = d1 * multfactor
@@ -136,6 +426,71 @@ def slitoptimiser(
     # print '\n[d2star', optimal_d2star, ']'
     # print '_____________________________________________'
 
+    if verbose:
+        print("solver branch:", info.branch, "(%s)" % info.method)
+
+    if full_output:
+        return d1, d2, info
+    return d1, d2
+
+
+def slitoptimiser_batch(
+    footprints,
+    resolutions,
+    angles=1.0,
+    L12=2859.5,
+    L2S=276,
+    method="analytic",
+    full_output=False,
+):
+    """
+    Vectorised version of `slitoptimiser`.
+
+    All inputs are broadcast against each other, so that many
+    footprint/resolution/angle (and geometry) combinations can be calculated
+    in a single call.
+
+    footprints  - maximum footprint onto sample (mm)
+    resolutions - fractional dtheta/theta resolution (FWHM)
+    angles      - optional, angle of incidence in degrees
+    L12         - slit1-slit2 distance (mm)
+    L2S         - slit2-sample distance (mm)
+    method      - "analytic" (default), "brent" or "table"
+    full_output - if True also return a `fminbound.Result` holding arrays of
+                  the solver `branch`, `method`, `nfev`, `nit` and `status`.
+
+    Returns:
+        (d1, d2) arrays with the broadcast shape of the inputs.
+
+    """
+    footprints, resolutions, angles, L12, L2S = np.broadcast_arrays(
+        *[
+            np.asarray(v, dtype=float)
+            for v in (footprints, resolutions, angles, L12, L2S)
+        ]
+    )
+    L1star = 0.68 * footprints / L12 / resolutions
+    ratio = L2S / L12
+
+    # the normalised problem only depends on (L1star, ratio), so only solve
+    # each distinct pair once.
+    pairs = np.stack([L1star.ravel(), ratio.ravel()], axis=-1)
+    unique_pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    d1star, multfactor, info = _optimal_dstar_batch(
+        unique_pairs[:, 0], unique_pairs[:, 1], method=method
+    )
+
+    inverse = inverse.ravel()
+    d1star = d1star[inverse].reshape(L1star.shape)
+    multfactor = multfactor[inverse].reshape(L1star.shape)
+
+    d1 = d1star * resolutions / 0.68 * np.radians(angles) * L12
+    d2 = d1 * multfactor
+    if full_output:
+        info = fminbound.Result(
+            {k: v[inverse].reshape(L1star.shape) for k, v in info.items()}
+        )
+        return d1, d2, info
     return d1, d2
 
 
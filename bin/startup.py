@@ -0,0 +1,77 @@
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+Cold-start bookkeeping: how long each module import (or other startup step)
+took, and deferred imports of heavy, rarely needed modules.
+"""
+
+# time.perf_counter() when this module was first imported
+started = time.perf_counter()
+
+# {step name: seconds}, in the order the steps happened
+timings = {}
+
+
+@contextmanager
+def timed(name):
+    """
+    Context manager recording the time spent in a startup step.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class LazyModule:
+    """
+    Defers importing a module until it is first needed.
+
+    Parameters:
+        name - module to import
+
+    Use `load()` to get the module, or `prewarm()` to import it in a
+    background thread.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    with timed(f"import {self.name}"):
+                        self._module = importlib.import_module(self.name)
+        return self._module
+
+    def prewarm(self):
+        """
+        Import the module in a daemon thread, so the first request that needs
+        it doesn't have to wait.
+        """
+        thread = threading.Thread(
+            target=self.load, name=f"prewarm-{self.name}", daemon=True
+        )
+        thread.start()
+        return thread
+
+
+def report():
+    """
+    Returns the startup timings (ms), and the time since startup began (s).
+    """
+    return {
+        "uptime": time.perf_counter() - started,
+        "timings_ms": {k: v * 1000 for k, v in timings.items()},
+    }
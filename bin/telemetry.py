@@ -0,0 +1,288 @@
+import bisect
+import collections
+import threading
+
+import numpy as np
+
+"""
+Minimal metrics (counters, gauges and histograms), rendered in the
+Prometheus text exposition format.
+"""
+
+# latency buckets (s)
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} needs labels {self.labelnames}")
+        return tuple(labels[n] for n in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda kv: str(kv[0]))
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {value!r}"
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def inc_many(self, amounts):
+        """
+        Increments several label combinations with one update.
+
+        Parameters:
+            amounts - dict of {label values tuple: amount}
+        """
+        with self._lock:
+            for key, amount in amounts.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """
+    A gauge whose values are set explicitly, or supplied by `callback` (which
+    returns {label values tuple: value}) when the metric is rendered.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        if self.callback is not None:
+            values = self.callback()
+            with self._lock:
+                self._values = dict(values)
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def observe_many(self, values, **labels):
+        """
+        Observe every element of an array of values, with one update.
+        """
+        values = np.ravel(values)
+        if not values.size:
+            return
+        key = self._key(labels)
+        if values.size < 64:
+            # numpy's overhead outweighs the work for a few values
+            binned = [0] * (len(self.buckets) + 1)
+            for value in values.tolist():
+                binned[bisect.bisect_left(self.buckets, value)] += 1
+            total = float(sum(values.tolist()))
+        else:
+            # same bucket as bisect_left in `observe`
+            idx = np.searchsorted(self.buckets, values, side="left")
+            binned = np.bincount(idx, minlength=len(self.buckets) + 1).tolist()
+            total = float(values.sum())
+        with self._lock:
+            counts, previous = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0.0)
+            )
+            counts = [a + b for a, b in zip(counts, binned)]
+            self._values[key] = (counts, previous + total)
+
+    def count(self, **labels):
+        counts, total = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def _render_samples(self, items):
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, key + (le,))} {cumulative}")
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwds):
+        return self.register(Counter(*args, **kwds))
+
+    def gauge(self, *args, **kwds):
+        return self.register(Gauge(*args, **kwds))
+
+    def histogram(self, *args, **kwds):
+        return self.register(Histogram(*args, **kwds))
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_latency = registry.histogram(
+    "refcalc_request_duration_seconds",
+    "Time taken to handle a request.",
+    ("route", "method"),
+)
+template_latency = registry.histogram(
+    "refcalc_template_render_seconds",
+    "Time taken to render a template.",
+    ("template",),
+)
+solver_calls = registry.counter(
+    "refcalc_solver_calls_total",
+    "Slit solutions calculated, by the solver method used and the branch taken.",
+    ("method", "branch"),
+)
+solver_nfev = registry.histogram(
+    "refcalc_solver_nfev",
+    "Objective function evaluations per slit solution.",
+    buckets=(0, 1, 5, 10, 20, 30, 50, 100, 500),
+)
+solver_nit = registry.histogram(
+    "refcalc_solver_iterations",
+    "Minimiser iterations per slit solution.",
+    buckets=(0, 1, 5, 10, 20, 30, 50, 100, 500),
+)
+solver_maxfev = registry.counter(
+    "refcalc_solver_maxfev_total",
+    "Slit solutions where the minimiser reached the maximum number of function evaluations.",
+)
+graph_evaluations = registry.counter(
+    "refcalc_graph_evaluations_total",
+    "Evaluations of the angulator's dependency graph.",
+)
+graph_recomputed = registry.counter(
+    "refcalc_graph_recomputed_total",
+    "Derived values of the angulator that were recomputed (the others were memoised).",
+    ("node",),
+)
+
+
+def record_graph(recomputed):
+    """
+    Record an evaluation of a `depgraph.Graph`, and which of its nodes were
+    recomputed. A node was memoised in the other evaluations.
+    """
+    graph_evaluations.inc()
+    if recomputed:
+        graph_recomputed.inc_many({(node,): 1 for node in recomputed})
+
+
+def record_solver(info):
+    """
+    Record the solver statistics from the `info` Result returned by
+    `slitoptimiser.slitoptimiser_batch(..., full_output=True)` (or the
+    scalar version).
+    """
+    method = np.ravel(info["method"])
+    branch = np.ravel(info["branch"])
+    status = np.ravel(info["status"])
+    n = max(method.size, branch.size)
+
+    # aggregate the lanes first, then update each metric once
+    if method.size != n:
+        method = np.broadcast_to(method, n)
+    if branch.size != n:
+        branch = np.broadcast_to(branch, n)
+    pairs = collections.Counter(zip(method.tolist(), branch.tolist()))
+    for (m, b), count in pairs.items():
+        solver_calls.inc(count, method=str(m), branch=str(b))
+
+    solver_nfev.observe_many(np.asarray(info["nfev"], dtype=int))
+    solver_nit.observe_many(np.asarray(info["nit"], dtype=int))
+    maxfev = int(np.count_nonzero(status == 1))
+    if maxfev:
+        solver_maxfev.inc(maxfev)
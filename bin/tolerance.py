@@ -0,0 +1,191 @@
+import numpy as np
+
+from . import slitoptimiser, utils
+
+"""
+Monte Carlo propagation of mechanical tolerances through the collimation
+calculations.
+
+The distances (L12, L2S, LS4, LpreS1) and the slit openings (d1, d2) are
+sampled from distributions around their nominal values, and the footprint,
+angular resolution and beam heights at the pre-S1 and post-sample slits
+calculated for every sample. Samples are processed in fixed size chunks and
+accumulated into histograms, so memory use doesn't depend on the number of
+samples.
+"""
+
+# the inputs that can have a tolerance
+INPUTS = ("L12", "L2S", "LS4", "LpreS1", "d1", "d2")
+
+# width is the standard deviation for "normal", and the half width for
+# "uniform" and "triangular"
+DISTRIBUTIONS = ("normal", "uniform", "triangular")
+
+QUANTITIES = (
+    "footprint",
+    "penumbra_footprint",
+    "dtheta",
+    "resolution",
+    "preS1slit",
+    "postsampleslit",
+)
+
+PERCENTILES = (2.5, 16, 50, 84, 97.5)
+
+# number of histogram bins used to estimate the percentiles
+_NBINS = 8192
+
+
+def _sample(rng, nominal, tolerance, size):
+    """
+    Samples of an input. `tolerance` is None or (distribution, width).
+    """
+    nominal = np.asarray(nominal, dtype=float)
+    if tolerance is None:
+        return np.broadcast_to(nominal, size)
+
+    kind, width = tolerance
+    if kind == "normal":
+        offset = rng.standard_normal(size)
+    elif kind == "uniform":
+        offset = rng.uniform(-1.0, 1.0, size)
+    elif kind == "triangular":
+        offset = rng.triangular(-1.0, 0.0, 1.0, size)
+    else:
+        raise ValueError(f"distribution should be one of {DISTRIBUTIONS}")
+    return nominal + float(width) * offset
+
+
+def _evaluate(d1, d2, angles, L12, L2S, LS4, LpreS1):
+    """
+    All QUANTITIES for arrays of inputs, with shape (n, nangles).
+    """
+    umbra, penumbra = slitoptimiser.actual_footprint(d1, d2, L12, L2S, angles)
+    dtheta = utils.div(d1, d2, L12)[0]
+    pre = slitoptimiser.height_of_beam_after_dx(d1, d2, L12, -LpreS1)[1]
+    post = slitoptimiser.height_of_beam_after_dx(d1, d2, L12, LS4 + L2S)[1]
+    return {
+        "footprint": umbra,
+        "penumbra_footprint": penumbra,
+        "dtheta": dtheta,
+        "resolution": dtheta / angles,
+        "preS1slit": pre,
+        "postsampleslit": post,
+    }
+
+
+def propagate(
+    d1,
+    d2,
+    angles,
+    L12,
+    L2S,
+    LS4,
+    LpreS1,
+    tolerances,
+    nsamples=100000,
+    chunk_size=16384,
+    percentiles=PERCENTILES,
+    seed=None,
+):
+    """
+    Percentiles of the footprint, resolution and beam heights, given
+    tolerances on the distances and slit openings.
+
+    Parameters:
+        d1, d2 - nominal slit openings for each angle, shape (nangles,)
+        angles - angles of incidence (degrees), shape (nangles,)
+        L12, L2S, LS4, LpreS1 - nominal distances
+        tolerances - dict mapping names in INPUTS to
+            (distribution, width) tuples. The distances are shared by all
+            angles of a sample, the slit openings are sampled separately for
+            each angle.
+        nsamples - number of Monte Carlo samples
+        chunk_size - number of samples processed at once
+        percentiles - percentiles to report
+        seed - seed for the random number generator
+
+    Returns:
+        dict mapping each name in QUANTITIES to a dict with "nominal",
+        "mean" and "std" (shape (nangles,)), and "percentiles"
+        (shape (len(percentiles), nangles)). dtheta is the FWHM in degrees.
+    """
+    unknown = set(tolerances) - set(INPUTS)
+    if unknown:
+        raise ValueError(f"unknown tolerances {sorted(unknown)}")
+    for kind, width in tolerances.values():
+        if kind not in DISTRIBUTIONS:
+            raise ValueError(f"distribution should be one of {DISTRIBUTIONS}")
+        if not 0 <= width < np.inf:
+            raise ValueError("tolerance widths must be non-negative")
+    if nsamples < 1:
+        raise ValueError("nsamples must be at least 1")
+    if np.any((np.asarray(percentiles) < 0) | (np.asarray(percentiles) > 100)):
+        raise ValueError("percentiles must be in [0, 100]")
+
+    angles = np.atleast_1d(np.asarray(angles, dtype=float))
+    d1 = np.broadcast_to(np.asarray(d1, dtype=float), angles.shape)
+    d2 = np.broadcast_to(np.asarray(d2, dtype=float), angles.shape)
+    nominal = _evaluate(d1, d2, angles, L12, L2S, LS4, LpreS1)
+
+    rng = np.random.default_rng(seed)
+    nangles = angles.size
+    columns = np.arange(nangles)
+
+    total = {k: np.zeros(nangles) for k in QUANTITIES}
+    total2 = {k: np.zeros(nangles) for k in QUANTITIES}
+    hist = {k: np.zeros((nangles, _NBINS), dtype=np.int64) for k in QUANTITIES}
+    ranges = {}
+
+    done = 0
+    while done < nsamples:
+        n = min(chunk_size, nsamples - done)
+        distances = [
+            _sample(rng, nominal_value, tolerances.get(name), (n, 1))
+            for name, nominal_value in zip(INPUTS[:4], (L12, L2S, LS4, LpreS1))
+        ]
+        w1 = _sample(rng, d1, tolerances.get("d1"), (n, nangles))
+        w2 = _sample(rng, d2, tolerances.get("d2"), (n, nangles))
+        values = _evaluate(np.abs(w1), np.abs(w2), angles, *distances)
+
+        for k in QUANTITIES:
+            v = np.broadcast_to(values[k], (n, nangles))
+            total[k] += v.sum(axis=0)
+            total2[k] += np.einsum("ij,ij->j", v, v)
+
+            if k not in ranges:
+                # the histogram range is set from the first chunk, widened
+                # so that later chunks rarely fall outside it. Any that do
+                # are put in the end bins.
+                lo, hi = v.min(axis=0), v.max(axis=0)
+                pad = np.maximum(hi - lo, 1e-12 * np.abs(hi) + 1e-300) * 0.5
+                ranges[k] = (lo - pad, (hi - lo + 2 * pad) / _NBINS)
+            lo, width = ranges[k]
+            idx = ((v - lo) * (1.0 / width)).astype(np.int64)
+            np.clip(idx, 0, _NBINS - 1, out=idx)
+            hist[k] += np.bincount(
+                (idx + columns * _NBINS).ravel(), minlength=nangles * _NBINS
+            ).reshape(nangles, _NBINS)
+        done += n
+
+    q = np.asarray(percentiles, dtype=float)[:, None] / 100.0
+    out = {}
+    for k in QUANTITIES:
+        mean = total[k] / nsamples
+        var = np.maximum(total2[k] / nsamples - mean * mean, 0)
+
+        # percentiles from the cumulative histogram, interpolating in a bin
+        lo, width = ranges[k]
+        cdf = np.cumsum(hist[k], axis=1) / nsamples
+        pct = np.empty((q.shape[0], nangles))
+        for j in range(nangles):
+            edges = lo[j] + width[j] * np.arange(_NBINS + 1)
+            pct[:, j] = np.interp(q[:, 0], np.r_[0, cdf[j]], edges)
+
+        out[k] = {
+            "nominal": np.broadcast_to(nominal[k], angles.shape).copy(),
+            "mean": mean,
+            "std": np.sqrt(var),
+            "percentiles": pct,
+        }
+    return out
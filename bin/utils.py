@@ -2,9 +2,6 @@
 from __future__ import division
 import numpy as np
 
-# import scipy.stats as ss
-# import scipy.integrate as spi
-
 
 def div(d1, d2, L12=2859):
     """
@@ -57,13 +54,13 @@ def qcalc2(omega, twotheta, phi, wavelength):
     twotheta - angle between xy plane and reflected beam PLUS omega.
     phi - angle between reflected beam and yz plane.
     returns a cartesian vector (Qx, Qy, Qz)
+    all of the arguments are broadcast against each other.
     """
 
     # convert to radians
     omega = np.radians(omega)
     twotheta = np.radians(twotheta)
-    xsi = np.radians(xsi)
-    # print "twotheta - omega=", cos(twotheta - omega) * cos(xsi), cos(omega)
+    phi = np.radians(phi)
     qx = 2 * np.pi / wavelength * np.cos(twotheta - omega) * np.sin(phi)
     qy = (
         2
@@ -116,30 +113,3 @@ def xrayenergy(wavelength):
     """
     return 12.398 / wavelength
 
-
-# def beamfrac(FWHM, length, angle):
-#     '''
-#     return the beam fraction intercepted by a sample of length length
-#     at sample tilt angle.
-#     The beam is assumed to be gaussian, with a FWHM of FWHM.
-#     '''
-#     height_of_sample = length * np.sin(np.radians(angle))
-#     beam_sd = FWHM / 2 / np.sqrt(2 * np.log(2))
-#     probability = 2. * (ss.norm.cdf(height_of_sample / 2. / beam_sd) - 0.5)
-#     return probability
-#
-# def beamfrackernel(kernelx, kernely, length, angle):
-#     '''
-#     return the beam fraction intercepted by a sample of length length
-#     at sample tilt angle.
-#     The beam has the shape 'kernel', a 2 row array, which gives the PDF for the beam
-#     intensity as a function of height. The first row is position, the second row is
-#     probability at that position
-#     '''
-#     height_of_sample = length * np.sin(np.radians(angle))
-#     total = spi.simps(kernely, kernelx)
-#     lowlimit = np.where(-height_of_sample / 2. >= kernelx)[0][-1]
-#     hilimit = np.where(height_of_sample / 2. <= kernelx)[0][0]
-#
-#     area = spi.simps(kernely[lowlimit: hilimit + 1], kernelx[lowlimit: hilimit + 1])
-#     return area / total
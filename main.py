@@ -1,8 +1,47 @@
-import tomllib
-from flask import Flask, render_template, request
-from bin import slitoptimiser, utils
+import hashlib
+import json
+import os
+import time
+from bin import startup
 
-import periodictable as pt
+with startup.timed("import numpy"):
+    import numpy as np
+with startup.timed("import flask"):
+    from flask import (
+        Flask,
+        Response,
+        before_render_template,
+        g,
+        jsonify,
+        render_template,
+        request,
+        template_rendered,
+        url_for,
+    )
+with startup.timed("import bin"):
+    from bin import (
+        angleplanner,
+        beamprofile,
+        cache,
+        contrast,
+        depgraph,
+        envelope,
+        fluxoptimiser,
+        instruments,
+        qresolution,
+        reflect,
+        singleflight,
+        sld,
+        slitoptimiser,
+        telemetry,
+        tolerance,
+        utils,
+    )
+
+# periodictable is only needed by /sld, and its import is deferred until it's
+# first used. Optionally import it in the background straight away.
+if os.environ.get("REFCALC_PREWARM", "0") == "1":
+    sld.periodictable.prewarm()
 
 
 # If `entrypoint` is not defined in app.yaml, App Engine will look for an app
@@ -10,12 +49,37 @@ import periodictable as pt
 app = Flask(__name__)
 
 
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.teardown_request
+def _record_latency(exc=None):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        telemetry.request_latency.observe(
+            time.perf_counter() - start, route=route, method=request.method
+        )
+
+
+@before_render_template.connect_via(app)
+def _start_render_timer(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def _record_render_time(sender, template, context, **extra):
+    start = g.pop("render_start", None)
+    if start is not None:
+        telemetry.template_latency.observe(
+            time.perf_counter() - start, template=template.name
+        )
+
+
 defaultd = {
     "instrument": "Platypus",
-    # "L12": 2990.9,
-    # "L2S": 144,
-    # "LS4": 444.5,
-    # "LpreS1": 2166,
     "resolution": 0.033,
     "footprint": 50,
     "lambdamin": 2.8,
@@ -31,9 +95,86 @@ defaultd = {
     "length": 50,
     "width": 40,
 }
-with open("bin/config.toml", "rb") as f:
-    instrument_config = tomllib.load(f)
-defaultd.update(instrument_config["Platypus"])
+# upper limit on the number of Monte Carlo samples of a tolerance calculation
+MAX_TOLERANCE_SAMPLES = 1000000
+
+# upper limit on the number of (angle, position) values in a beam envelope
+MAX_ENVELOPE_VALUES = 2000000
+
+# upper limit on the number of (angle, wavelength or Q bin) values calculated
+# by /api/qresolution
+MAX_QRESOLUTION_VALUES = 2000000
+
+# upper limit on the number of candidate angles given to /api/angles, the
+# planner scores every (first, last) pair of them
+MAX_PLANNER_CANDIDATES = 200
+
+# upper limit on the number of angles in a /api/flux request, each is a grid
+# search
+MAX_FLUX_ANGLES = 1000
+
+# upper limit on the number of (angle, wavelength bin, quadrature point, layer)
+# values in a /api/reflectivity calculation
+MAX_REFLECTIVITY_VALUES = 2000000
+
+# Instrument profiles are reloaded if config.toml changes. Each profile
+# precomputes a lookup table of the normalised slit solution, which only
+# depends on L2S / L12.
+with startup.timed("load instruments"):
+    instrument_registry = instruments.InstrumentRegistry(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin", "config.toml")
+    )
+
+# results of slit calculations, shared by /slits and /singleslit
+slit_cache = cache.LRUCache(int(os.environ.get("REFCALC_SLIT_CACHE_SIZE", 4096)))
+
+# concurrent slit calculations with the same inputs share one calculation
+slit_flight = singleflight.Group()
+
+_flights = {
+    "slits": slit_flight,
+    "formulae": sld.formula_flight,
+    "slds": sld.sld_flight,
+}
+telemetry.registry.gauge(
+    "refcalc_singleflight",
+    "Calls that did a calculation, and calls that shared one already in flight.",
+    ("group", "stat"),
+    callback=lambda: {
+        (name, stat): value
+        for name, f in _flights.items()
+        for stat, value in f.stats().items()
+    },
+)
+
+# serialised slit solution tables, served to the browser by /api/slittable
+table_cache = cache.LRUCache(16)
+# the versioned /api/slittable URL of each instrument profile
+table_url_cache = cache.LRUCache(16)
+
+_caches = {
+    "slits": slit_cache,
+    "slit tables": table_cache,
+    "slit table urls": table_url_cache,
+    "formulae": sld.formula_cache,
+    "slds": sld.sld_cache,
+}
+telemetry.registry.gauge(
+    "refcalc_cache",
+    "Cache statistics.",
+    ("cache", "stat"),
+    callback=lambda: {
+        (name, stat): value
+        for name, c in _caches.items()
+        for stat, value in c.stats().items()
+    },
+)
+telemetry.registry.gauge(
+    "refcalc_startup_seconds",
+    "Time taken by each startup step.",
+    ("step",),
+    callback=lambda: {(k,): v for k, v in startup.timings.items()},
+)
 
 
 @app.route("/")
@@ -41,54 +182,400 @@ def index():
     return render_template("index.html")
 
 
+def defaults(instrument="Platypus"):
+    """
+    A new dict of the default settings, with the distances of an instrument.
+    """
+    dct = defaultd.copy()
+    dct["instrument"] = instrument
+    dct.update(instrument_registry[instrument].distances())
+    return dct
+
+
 @app.route("/slits", methods=["POST", "GET"])
 def slits():
-    dct = defaultd.copy()
+    dct = defaults()
 
     if request.method == "POST":
-        dct = {k: v for k, v in request.form.items()}
-        instrument = dct.get("instrument", "Platypus")
-        if instrument != defaultd.get("instrument", "Platypus"):
+        form = {k: v for k, v in request.form.items()}
+        instrument = form.get("instrument", "Platypus")
+        if instrument not in instrument_registry:
+            instrument = form["instrument"] = "Platypus"
+        dct = defaults(instrument)
+        dct.update(form)
+        if instrument != form.get("previous_instrument", instrument):
             # we're changing the instrument type, update distances
-            defaultd["instrument"] = instrument
-            settings = instrument_config[instrument]
-            dct.update(settings)
-            # defaultd.update(settings)
+            dct.update(instrument_registry[instrument].distances())
 
+    dct["instruments"] = instrument_registry.names()
+    profile = instrument_registry[dct["instrument"]]
+    dct["slittable_url"] = table_url_cache.get_or_compute(
+        profile, _slit_table_url, profile
+    )
     calculate_variables(dct)
     return render_template("angulator.html", d=dct)
 
 
+def _slit_table_payload(profile):
+    """
+    Compact JSON of the normalised slit solution table of an instrument, and
+    its ETag.
+    """
+    table = profile.slit_table
+    body = json.dumps(
+        {
+            "instrument": profile.name,
+            "ratio": table.ratio,
+            "xtol": table.xtol,
+            "L1star": np.round(table.L1star, 9).tolist(),
+            "d2star": np.round(table.d2star, 9).tolist(),
+        },
+        separators=(",", ":"),
+    ).encode()
+    return body, hashlib.sha1(body).hexdigest()[:16]
+
+
+def _slit_table_url(profile):
+    """
+    URL of the slit solution table of an instrument, versioned by its ETag.
+    """
+    _, etag = table_cache.get_or_compute(profile, _slit_table_payload, profile)
+    return url_for("slit_table", instrument=profile.name, v=etag)
+
+
+@app.route("/api/slittable/<instrument>")
+def slit_table(instrument):
+    """
+    The normalised slit solution table of an instrument, d2* vs L1* on the
+    optimal branch, from which the angulator page recalculates the slit
+    settings in the browser.
+
+    The response has an ETag. Requests that give the current ETag as the
+    `v` query parameter (as the URL in the angulator page does) can be cached
+    indefinitely, the URL changes whenever the table does.
+    """
+    if instrument not in instrument_registry:
+        return jsonify(error=f"unknown instrument {instrument!r}"), 404
+    profile = instrument_registry[instrument]
+    body, etag = table_cache.get_or_compute(profile, _slit_table_payload, profile)
+
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    if request.args.get("v") == etag:
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @app.route("/singleslit", methods=["POST", "GET"])
 def singleslit():
 
     if request.method == "GET":
-        return f"send a post request setting variables in ', {defaultd.keys()}"
+        return f"send a post request setting variables in ', {defaults().keys()}"
 
     elif request.method == "POST":
 
-        dct = defaultd.copy()
-        _form = {k: float(v) for k, v in request.form.items() if k in dct}
+        instrument = request.form.get("instrument", "Platypus")
+        if instrument not in instrument_registry:
+            return f"unknown instrument {instrument!r}", 400
+        dct = defaults(instrument)
+        _form = {
+            k: float(v)
+            for k, v in request.form.items()
+            if k in dct and k != "instrument"
+        }
 
         dct.update(_form)
 
-        d1, d2 = slitoptimiser.slitoptimiser(
+        ((d1, d2, preslit, postslit),) = slit_settings(
             dct["footprint"],
             dct["resolution"],
-            angle=dct["a1"],
-            L12=dct["L12"],
-            L2S=dct["L2S"],
-            verbose=False,
+            [dct["a1"]],
+            dct["L12"],
+            dct["L2S"],
+            dct["LS4"],
+            dct["LpreS1"],
         )
 
-        postslit = slitoptimiser.height_of_beam_after_dx(
-            d1, d2, dct["L12"], dct["LS4"] + dct["L2S"]
+        return f"{(preslit[1], d1, d2, postslit[1])}"
+
+
+@app.route("/api/slits", methods=["POST"])
+def api_slits():
+    """
+    Slit settings for many samples and angles in one request.
+
+    Expects a JSON array of jobs, each of the form
+    {"instrument": "Platypus", "footprint": 50, "resolution": 0.033,
+     "angles": [0.8, 3.5], "L12": ..., "L2S": ..., "LS4": ..., "LpreS1": ...}
+    where the distances are optional and default to those of the instrument.
+    """
+    jobs = request.get_json(silent=True)
+    if not isinstance(jobs, list):
+        return jsonify(error="expected a JSON array of jobs"), 400
+
+    try:
+        columns, counts = _slit_job_columns(jobs)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"invalid job: {e}"), 400
+
+    footprint, resolution, angle, L12, L2S, LS4, LpreS1 = columns
+    d1, d2, info = slitoptimiser.slitoptimiser_batch(
+        footprint, resolution, angle, L12=L12, L2S=L2S, method="table", full_output=True
+    )
+    telemetry.record_solver(info)
+    preS1 = slitoptimiser.height_of_beam_after_dx(d1, d2, L12, -LpreS1)[1]
+    postsample = slitoptimiser.height_of_beam_after_dx(d1, d2, L12, LS4 + L2S)[1]
+    umbra, penumbra = slitoptimiser.actual_footprint(d1, d2, L12, L2S, angle)
+    dtheta = utils.div(d1, d2, L12)[0]
+
+    # each job is a contiguous run of rows, convert to lists once and slice
+    outputs = {
+        "angles": angle,
+        "d1": d1,
+        "d2": d2,
+        "preS1slit": preS1,
+        "postsampleslit": postsample,
+        "actualfootprint_umbra": umbra,
+        "actualfootprint_penumbra": penumbra,
+        "dtheta": dtheta,
+    }
+    outputs = {k: np.asarray(v).tolist() for k, v in outputs.items()}
+    stops = np.cumsum(counts).tolist()
+    starts = [0] + stops[:-1]
+
+    results = []
+    for job, start, stop in zip(jobs, starts, stops):
+        result = {
+            "instrument": job.get("instrument", "Platypus"),
+            "footprint": float(job["footprint"]),
+            "resolution": float(job["resolution"]),
+        }
+        result.update((k, v[start:stop]) for k, v in outputs.items())
+        results.append(result)
+    return jsonify(results=results)
+
+
+@app.route("/api/uncertainty", methods=["POST"])
+def api_uncertainty():
+    """
+    Monte Carlo propagation of tolerances in the distances and slit openings
+    to the footprint, resolution and beam heights.
+
+    Expects JSON of the form
+    {"instrument": "Platypus", "footprint": 50, "resolution": 0.033,
+     "angles": [0.8, 3.5], "tolerances": {"L12": ["normal", 2],
+     "d1": ["uniform", 0.01]}, "nsamples": 100000, "seed": 1}
+    where the slit openings can be given directly with "d1" and "d2", and
+    the distances default to those of the instrument. Each tolerance is a
+    (distribution, width) pair, see `tolerance.DISTRIBUTIONS`.
+    """
+    dct = request.get_json(silent=True)
+    if not isinstance(dct, dict):
+        return jsonify(error="expected a JSON object"), 400
+
+    try:
+        profile = instrument_registry[dct.get("instrument", "Platypus")]
+        L12, L2S, LS4, LpreS1 = (
+            float(dct.get(k, getattr(profile, k))) for k in instruments.DISTANCES
         )
-        preslit = slitoptimiser.height_of_beam_after_dx(
-            d1, d2, dct["L12"], -dct["LpreS1"]
+        angles = np.asarray(dct["angles"], dtype=float).ravel()
+        if "d1" in dct and "d2" in dct:
+            d1 = np.asarray(dct["d1"], dtype=float)
+            d2 = np.asarray(dct["d2"], dtype=float)
+        else:
+            d1, d2 = slitoptimiser.slitoptimiser_batch(
+                float(dct["footprint"]),
+                float(dct["resolution"]),
+                angles,
+                L12=L12,
+                L2S=L2S,
+                method="table",
+            )
+        tolerances = dct.get("tolerances", {})
+        if not isinstance(tolerances, dict):
+            raise TypeError("tolerances must be an object")
+        tolerances = {
+            name: (str(kind), float(width))
+            for name, (kind, width) in tolerances.items()
+        }
+        nsamples = int(dct.get("nsamples", 100000))
+        if not 0 < nsamples <= MAX_TOLERANCE_SAMPLES:
+            raise ValueError(f"nsamples must be in (0, {MAX_TOLERANCE_SAMPLES}]")
+        result = tolerance.propagate(
+            d1,
+            d2,
+            angles,
+            L12,
+            L2S,
+            LS4,
+            LpreS1,
+            tolerances,
+            nsamples=nsamples,
+            percentiles=dct.get("percentiles", tolerance.PERCENTILES),
+            seed=dct.get("seed"),
         )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"invalid request: {e}"), 400
 
-        return f"{(preslit[1], d1, d2, postslit[1])}"
+    return jsonify(
+        angles=angles.tolist(),
+        d1=np.broadcast_to(d1, angles.shape).tolist(),
+        d2=np.broadcast_to(d2, angles.shape).tolist(),
+        **{
+            k: {stat: v.tolist() for stat, v in stats.items()}
+            for k, stats in result.items()
+        },
+    )
+
+
+@app.route("/api/envelope", methods=["GET", "POST"])
+def api_envelope():
+    """
+    Beam envelope from before slit 1 to the detector, for each angle, as a
+    binary float32 array of shape (3, nangles, npoints) (see
+    `envelope.CHANNELS`).
+
+    Query (or form) parameters: instrument, angles (repeated), footprint and
+    resolution, or d1 and d2 (repeated, one per angle), npoints (default
+    1000), LSD (default 2500), format ("npy", the default, or "raw"). The
+    distances default to those of the instrument.
+
+    The array is sent straight from its buffer. Positions are
+    linspace(X-Envelope-Start, X-Envelope-Stop, npoints) and the slit, sample
+    and detector positions are in X-Envelope-Markers (JSON). For "raw" the
+    shape and dtype are in X-Envelope-Shape and X-Envelope-Dtype.
+    """
+    values = request.values
+    try:
+        profile = instrument_registry[values.get("instrument", "Platypus")]
+        L12, L2S, LS4, LpreS1 = (
+            float(values.get(k, getattr(profile, k))) for k in instruments.DISTANCES
+        )
+        LSD = float(values.get("LSD", 2500))
+        angles = np.array(values.getlist("angles"), dtype=float)
+        npoints = int(values.get("npoints", 1000))
+        fmt = values.get("format", "npy")
+        if not angles.size:
+            raise ValueError("no angles")
+        if "d1" in values and "d2" in values:
+            d1 = np.array(values.getlist("d1"), dtype=float)
+            d2 = np.array(values.getlist("d2"), dtype=float)
+            if d1.shape != angles.shape or d2.shape != angles.shape:
+                raise ValueError("need one d1 and d2 for each angle")
+        else:
+            d1, d2 = slitoptimiser.slitoptimiser_batch(
+                float(values["footprint"]),
+                float(values["resolution"]),
+                angles,
+                L12=L12,
+                L2S=L2S,
+                method="table",
+            )
+        if not (2 <= npoints and angles.size * npoints <= MAX_ENVELOPE_VALUES):
+            raise ValueError(
+                f"need npoints >= 2 and nangles * npoints <= {MAX_ENVELOPE_VALUES}"
+            )
+        if fmt not in ("npy", "raw"):
+            raise ValueError("format should be 'npy' or 'raw'")
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"invalid request: {e}"), 400
+
+    z = envelope.positions(L12, L2S, LpreS1, LSD=LSD, npoints=npoints)
+    array = envelope.envelope(d1, d2, angles, z, L12, L2S)
+
+    # no per-value encoding, the response body is the header followed by the
+    # array's memory. WSGI needs bytes, so the memory is streamed in chunks
+    # rather than copied in one go.
+    body = memoryview(array).cast("B")
+    header = envelope.npy_header(array) if fmt == "npy" else b""
+    response = Response(
+        _buffer_chunks(header, body), mimetype="application/octet-stream"
+    )
+    response.content_length = len(header) + body.nbytes
+    response.headers.update(
+        {
+            "X-Envelope-Start": repr(float(z[0])),
+            "X-Envelope-Stop": repr(float(z[-1])),
+            "X-Envelope-Markers": json.dumps(
+                envelope.markers(L12, L2S, LS4, LpreS1, LSD=LSD)
+            ),
+            "X-Envelope-Shape": ",".join(str(n) for n in array.shape),
+            "X-Envelope-Dtype": array.dtype.str,
+            "Content-Disposition": f"attachment; filename=envelope.{fmt}",
+        }
+    )
+    return response
+
+
+def _buffer_chunks(header, body, chunk_size=1 << 20):
+    """
+    Yields `header`, then the bytes of the memoryview `body` in chunks.
+    """
+    yield header
+    for start in range(0, body.nbytes, chunk_size):
+        yield bytes(body[start : start + chunk_size])
+
+
+def _slit_job_columns(jobs):
+    """
+    Flattens a list of /api/slits jobs into one array per input quantity,
+    with one element per (job, angle) row, and the number of rows of each
+    job. The rows of a job are contiguous.
+    """
+    rows = []
+    counts = []
+    for job in jobs:
+        if not isinstance(job, dict):
+            raise TypeError("each job should be a JSON object")
+        profile = instrument_registry[job.get("instrument", "Platypus")]
+        footprint = float(job["footprint"])
+        resolution = float(job["resolution"])
+        distances = [
+            float(job.get(k, getattr(profile, k))) for k in instruments.DISTANCES
+        ]
+        angles = [float(angle) for angle in job["angles"]]
+        rows.extend((footprint, resolution, angle, *distances) for angle in angles)
+        counts.append(len(angles))
+
+    columns = np.array(rows, dtype=float).reshape(-1, 7)
+    # footprint, resolution, angle and L12 must be positive, the other
+    # distances can be zero
+    if not (
+        np.all(np.isfinite(columns))
+        and np.all(columns[:, :4] > 0)
+        and np.all(columns[:, 4:] >= 0)
+    ):
+        raise ValueError(
+            "footprint, resolution, angles and L12 must be positive, and the "
+            "other distances non-negative"
+        )
+    return tuple(columns.T), counts
+
+
+@app.route("/api/startup")
+def startup_report():
+    return jsonify(startup.report())
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(
+        telemetry.registry.render(), mimetype="text/plain; version=0.0.4"
+    )
+
+
+@app.route("/api/cache")
+def cache_stats():
+    return jsonify({name: c.stats() for name, c in _caches.items()})
+
+
+@app.route("/api/singleflight")
+def singleflight_stats():
+    return jsonify({name: f.stats() for name, f in _flights.items()})
 
 
 @app.route("/sld", methods=["POST", "GET"])
@@ -123,68 +610,693 @@ def slds():
         dct["density"] = density = float(dct["density"])
 
         try:
-            formula = pt.formula(
-                dct["formula"],
-            )
+            sld.formula(dct["formula"])
         except:
             return render_template("sldcalculator.html", d=dct)
 
         if volumetype == "volume":
-            density = formula.molecular_mass / formula.volume(a=volume, b=1, c=1)
+            density = sld.density_from_volume(dct["formula"], volume)
             dct["density"] = density
         elif volumetype == "density":
-            volume = formula.mass / density / pt.constants.avogadro_number * 1e24
+            volume = sld.volume_from_density(dct["formula"], density)
             dct["volume"] = volume
 
         try:
-            real, imag, mu = pt.neutron_sld(
-                formula, density=density, wavelength=float(dct["neutron_wavelength"])
+            dct["neutron_sld"] = sld.neutron_sld(
+                dct["formula"], density, float(dct["neutron_wavelength"])
             )
-            dct["neutron_sld"] = real + imag * 1j
-
-            real, imag = pt.xray_sld(
-                formula, density=density, energy=float(dct["xray_energy"])
+            dct["xray_sld"] = sld.xray_sld(
+                dct["formula"], density, float(dct["xray_energy"])
             )
-
-            dct["xray_sld"] = real + imag * 1j
         except (TypeError, AssertionError):
             pass
 
         return render_template("sldcalculator.html", d=dct)
 
 
+@app.route("/api/flux", methods=["POST"])
+def api_flux():
+    """
+    Flux-optimal slit settings and resolution for each angle.
+
+    Expects JSON of the form
+    {"instrument": "Platypus", "length": 50, "max_resolution": 0.05,
+     "angles": [0.8, 3.5, 6], "objective": "beamfraction", "width": 40,
+     "diagonal": false}
+    where "objective" is "slits" (default) or "beamfraction", and the
+    distances can be overridden with "L12" and "L2S".
+    """
+    dct = request.get_json(silent=True)
+    if not isinstance(dct, dict):
+        return jsonify(error="expected a JSON object"), 400
+
+    try:
+        profile = instrument_registry[dct.get("instrument", "Platypus")]
+        length = float(dct["length"])
+        max_resolution = float(dct["max_resolution"])
+        angles = np.asarray(dct["angles"], dtype=float).ravel()
+        L12 = float(dct.get("L12", profile.L12))
+        L2S = float(dct.get("L2S", profile.L2S))
+        width = dct.get("width")
+        width = None if width is None else float(width)
+        if not (0 < length < np.inf and 0 < max_resolution < np.inf):
+            raise ValueError("length and max_resolution must be positive")
+        if not (angles.size and np.all((angles > 0) & (angles < 90))):
+            raise ValueError("angles must be in (0, 90) degrees")
+        if angles.size > MAX_FLUX_ANGLES:
+            raise ValueError(f"at most {MAX_FLUX_ANGLES} angles can be optimised")
+        if not (0 < L12 < np.inf and 0 <= L2S < np.inf):
+            raise ValueError("need L12 > 0 and L2S >= 0")
+        if width is not None and not 0 < width < np.inf:
+            raise ValueError("width must be positive")
+        result = fluxoptimiser.flux_optimise(
+            length,
+            max_resolution,
+            angles,
+            L12=L12,
+            L2S=L2S,
+            objective=dct.get("objective", "slits"),
+            width=width,
+            diagonal=bool(dct.get("diagonal", False)),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"invalid request: {e}"), 400
+
+    return jsonify({k: _finite_or_none(v) for k, v in result.items()})
+
+
+@app.route("/api/angles", methods=["POST"])
+def api_angles():
+    """
+    Sets of angles that cover a Q range, ranked by counting time.
+
+    Expects JSON of the form
+    {"instrument": "Platypus", "qmin": 0.005, "qmax": 0.3,
+     "lambdamin": 2.8, "lambdamax": 18, "max_angles": 4, "min_overlap": 0.05,
+     "footprint": 50, "resolution": 0.033}
+    optionally with "candidates", a list of candidate angles.
+    """
+    dct = request.get_json(silent=True)
+    if not isinstance(dct, dict):
+        return jsonify(error="expected a JSON object"), 400
+
+    try:
+        profile = instrument_registry[dct.get("instrument", "Platypus")]
+        candidates = dct.get("candidates")
+        qmin, qmax = float(dct["qmin"]), float(dct["qmax"])
+        lambdamin = float(dct.get("lambdamin", 2.8))
+        lambdamax = float(dct.get("lambdamax", 18))
+        max_angles = int(dct.get("max_angles", 4))
+        if not (0 < qmin < qmax and 0 < lambdamin < lambdamax):
+            raise ValueError("need 0 < qmin < qmax and 0 < lambdamin < lambdamax")
+        if not 1 <= max_angles <= 6:
+            raise ValueError("max_angles must be between 1 and 6")
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=float).ravel()
+            if not np.all((candidates > 0) & (candidates < 90)):
+                raise ValueError("candidates must be in (0, 90) degrees")
+            if candidates.size > MAX_PLANNER_CANDIDATES:
+                raise ValueError(
+                    f"at most {MAX_PLANNER_CANDIDATES} candidates can be given"
+                )
+        result = angleplanner.plan_angles(
+            qmin,
+            qmax,
+            lambdamin,
+            lambdamax,
+            max_angles=max_angles,
+            min_overlap=float(dct.get("min_overlap", 0.05)),
+            candidates=candidates,
+            footprint=float(dct.get("footprint", 50)),
+            resolution=float(dct.get("resolution", 0.033)),
+            L12=profile.L12,
+            L2S=profile.L2S,
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"invalid request: {e}"), 400
+
+    return jsonify(plans=result)
+
+
+@app.route("/api/reflectivity", methods=["POST"])
+def api_reflectivity():
+    """
+    Smeared reflectivity, expected counts and counting time for each angle.
+
+    Expects JSON of the form
+    {"instrument": "Platypus", "layers": [[0, 0, 0, 0], [100, 3.47, 0, 3],
+     [0, 2.07, 0, 3]], "angles": [0.5, 2, 4], "footprint": 50,
+     "resolution": 0.033, "lambdamin": 2.8, "lambdamax": 18,
+     "dlambda": 0.033, "incident": 1e5, "precision": 0.05,
+     "qmax_fraction": 0.8}
+    where each layer is [thickness, SLD, iSLD, roughness]. Only bins below
+    qmax_fraction of the top Q of an angle count towards its time. The slit
+    openings can be given directly with "d1" and "d2" instead of
+    "footprint" and "resolution".
+    """
+    dct = request.get_json(silent=True)
+    if not isinstance(dct, dict):
+        return jsonify(error="expected a JSON object"), 400
+
+    try:
+        profile = instrument_registry[dct.get("instrument", "Platypus")]
+        layers = np.asarray(dct["layers"], dtype=float)
+        if layers.ndim != 2 or layers.shape[0] < 2 or layers.shape[1] != 4:
+            raise ValueError("layers should have shape (N + 2, 4)")
+        angles = np.asarray(dct["angles"], dtype=float).ravel()
+        if not (angles.size and np.all((angles > 0) & (angles < 90))):
+            raise ValueError("angles must be in (0, 90) degrees")
+        lambdamin = float(dct.get("lambdamin", 2.8))
+        lambdamax = float(dct.get("lambdamax", 18))
+        dlambda = float(dct.get("dlambda", 0.033))
+        if not (0 < lambdamin < lambdamax and 0 < dlambda):
+            raise ValueError("need 0 < lambdamin < lambdamax and 0 < dlambda")
+        if np.log(lambdamax / lambdamin) / np.log1p(dlambda) > 10000:
+            raise ValueError("too many wavelength bins")
+        wavelengths, _ = qresolution.wavelength_bins(lambdamin, lambdamax, dlambda)
+        # the smeared reflectivity is calculated at every quadrature point of
+        # every bin, for each layer
+        npoints = angles.size * wavelengths.size * reflect.gauss_kernel()[0].size
+        if npoints * layers.shape[0] > MAX_REFLECTIVITY_VALUES:
+            raise ValueError(
+                "nangles * nbins * nlayers is too large, reduce the number of"
+                " angles or layers, or increase dlambda"
+            )
+        if "d1" in dct and "d2" in dct:
+            d1 = np.asarray(dct["d1"], dtype=float)
+            d2 = np.asarray(dct["d2"], dtype=float)
+            if not (np.all(d1 >= 0) and np.all(d2 >= 0)):
+                raise ValueError("slit openings can't be negative")
+        else:
+            d1, d2 = slitoptimiser.slitoptimiser_batch(
+                float(dct.get("footprint", 50)),
+                float(dct.get("resolution", 0.033)),
+                angles,
+                L12=profile.L12,
+                L2S=profile.L2S,
+                method="table",
+            )
+        rates = reflect.count_rates(
+            layers,
+            angles,
+            d1,
+            d2,
+            L12=profile.L12,
+            lambdamin=lambdamin,
+            lambdamax=lambdamax,
+            dlambda=dlambda,
+            incident=float(dct.get("incident", 1e5)),
+        )
+        times, counts = reflect.counting_time(
+            rates["rate"],
+            precision=float(dct.get("precision", 0.05)),
+            qmax_fraction=float(dct.get("qmax_fraction", 1.0)),
+            Q=rates["Q"],
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"invalid request: {e}"), 400
+
+    return jsonify(
+        angles=angles.tolist(),
+        d1=np.broadcast_to(d1, angles.shape).tolist(),
+        d2=np.broadcast_to(d2, angles.shape).tolist(),
+        Q=rates["Q"].tolist(),
+        dQ=rates["dQ"].tolist(),
+        R=_finite_or_none(rates["R"]),
+        counts=_finite_or_none(counts),
+        # an angle with no intensity never reaches the precision
+        time=_finite_or_none(times),
+        total_time=_finite_or_none(times.sum()),
+        qcrit=float(reflect.critical_edge(layers)),
+    )
+
+
+def _finite_or_none(values):
+    """
+    `values.tolist()`, with NaN and infinite values (which aren't valid
+    JSON) replaced by None.
+    """
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+@app.route("/api/qresolution", methods=["POST"])
+def api_qresolution():
+    """
+    TOF Q resolution for each angle over every wavelength bin.
+
+    Expects JSON of the form
+    {"instrument": "Platypus", "footprint": 50, "resolution": 0.033,
+     "angles": [0.8, 3.5], "lambdamin": 2.8, "lambdamax": 18.5,
+     "bin_width": 0.01,
+     "chopper": {"frequency": 20, "opening": 2.0, "flight_length": 7500},
+     "rebin": 0.03}
+    The slit openings are optimised for the footprint and resolution unless
+    "d1" and "d2" (one per angle) are given. Instead of "chopper" a constant
+    fractional "wavelength_resolution" can be given. "rebin" is optional and
+    rebins (Q, dQ) onto a grid of constant dQ/Q.
+    """
+    dct = request.get_json(silent=True)
+    if not isinstance(dct, dict):
+        return jsonify(error="expected a JSON object"), 400
+
+    try:
+        profile = instrument_registry[dct.get("instrument", "Platypus")]
+        angles = np.asarray(dct["angles"], dtype=float)
+        L12 = float(dct.get("L12", profile.L12))
+        L2S = float(dct.get("L2S", profile.L2S))
+
+        bin_width = float(dct.get("bin_width", 0.01))
+        wavelengths, edges = qresolution.wavelength_bins(
+            float(dct["lambdamin"]), float(dct["lambdamax"]), bin_width
+        )
+        if angles.size * wavelengths.size > MAX_QRESOLUTION_VALUES:
+            raise ValueError(
+                f"nangles * nbins must be <= {MAX_QRESOLUTION_VALUES}, reduce the"
+                " number of angles or increase bin_width"
+            )
+
+        if "d1" in dct and "d2" in dct:
+            d1 = np.broadcast_to(np.asarray(dct["d1"], dtype=float), angles.shape)
+            d2 = np.broadcast_to(np.asarray(dct["d2"], dtype=float), angles.shape)
+        else:
+            d1, d2 = slitoptimiser.slitoptimiser_batch(
+                float(dct["footprint"]),
+                float(dct["resolution"]),
+                angles,
+                L12=L12,
+                L2S=L2S,
+                method="table",
+            )
+        if "chopper" in dct:
+            chopper = dct["chopper"]
+            dlambda = qresolution.chopper_resolution(
+                wavelengths,
+                float(chopper["frequency"]),
+                float(chopper["opening"]),
+                float(chopper["flight_length"]),
+                bin_width=bin_width,
+            )
+        else:
+            dlambda = float(dct["wavelength_resolution"])
+
+        Q, dQ = qresolution.tof_resolution(angles, wavelengths, d1, d2, L12, dlambda)
+        result = {
+            "angles": angles.tolist(),
+            "d1": np.asarray(d1).tolist(),
+            "d2": np.asarray(d2).tolist(),
+            "wavelength": wavelengths.tolist(),
+            "Q": Q.tolist(),
+            "dQ": dQ.tolist(),
+        }
+        if dct.get("rebin"):
+            grid = qresolution.constant_resolution_grid(
+                Q.min(),
+                Q.max(),
+                float(dct["rebin"]),
+                max_bins=min(
+                    qresolution.MAX_BINS, MAX_QRESOLUTION_VALUES // max(angles.size, 1)
+                ),
+            )
+            q, dq, counts = qresolution.rebin(Q, dQ, grid)
+            result["rebinned"] = {
+                "edges": grid.tolist(),
+                # NaN (empty bins) isn't valid JSON
+                "Q": np.where(counts > 0, q, None).tolist(),
+                "dQ": np.where(counts > 0, dq, None).tolist(),
+                "counts": counts.tolist(),
+            }
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"invalid request: {e}"), 400
+
+    return jsonify(result)
+
+
+@app.route("/api/sld", methods=["POST"])
+def api_sld():
+    """
+    SLD spectra: neutron SLD vs wavelength and/or X-ray SLD vs energy.
+
+    Accepts JSON, {"formula": "Gd2O3", "density": 7.4, "wavelengths": [...],
+    "energies": {"min": 5, "max": 10, "n": 1000}}, where "volume" can be given
+    instead of "density", and each grid is either a list of values or a
+    linearly spaced grid. Form data is also accepted, with the grids given by
+    wavelength_min/wavelength_max/wavelength_n and energy_min/energy_max/energy_n.
+    """
+    dct = request.get_json(silent=True)
+    if dct is None:
+        dct = _sld_form_spectrum(request.form)
+    if not isinstance(dct, dict) or "formula" not in dct:
+        return jsonify(error="a formula is required"), 400
+
+    compound = dct["formula"]
+    try:
+        sld.formula(compound)
+    except Exception:
+        return jsonify(error=f"could not parse formula {compound!r}"), 400
+
+    try:
+        if "volume" in dct and "density" not in dct:
+            volume = float(dct["volume"])
+            if not 0 < volume < np.inf:
+                raise ValueError("volume must be positive")
+            density = sld.density_from_volume(compound, volume)
+        else:
+            density = float(dct["density"])
+            if not 0 < density < np.inf:
+                raise ValueError("density must be positive")
+            volume = sld.volume_from_density(compound, density)
+
+        result = {"formula": compound, "density": density, "volume": volume}
+        if "wavelengths" in dct:
+            wavelengths = sld.grid(dct["wavelengths"])
+            real, imag = sld.neutron_sld_spectrum(compound, density, wavelengths)
+            result["neutron"] = {
+                "wavelength": wavelengths.tolist(),
+                "real": real.tolist(),
+                "imag": imag.tolist(),
+            }
+        if "energies" in dct:
+            energies = sld.grid(dct["energies"])
+            real, imag = sld.xray_sld_spectrum(compound, density, energies)
+            result["xray"] = {
+                "energy": energies.tolist(),
+                "real": real.tolist(),
+                "imag": imag.tolist(),
+            }
+    except (KeyError, TypeError, ValueError, AssertionError) as e:
+        return jsonify(error=f"invalid request: {e}"), 400
+
+    return jsonify(result)
+
+
+@app.route("/api/contrast", methods=["POST"])
+def api_contrast():
+    """
+    Contrast variation of a molecule in a H2O/D2O (or other) solvent mixture.
+
+    Accepts JSON (or the /sld form), {"formula": "C6H12O6", "density": 1.54,
+    "exchangeable": 5, "exchange_efficiency": 1, "solvent": ["H2O", "D2O"],
+    "solvent_density": [0.997, 1.107], "points": 101}, where "volume" can be
+    given instead of "density".
+    """
+    dct = request.get_json(silent=True)
+    if dct is None:
+        dct = {k: v for k, v in request.form.items()}
+        if dct.get("volumetype") == "volume":
+            dct.pop("density", None)
+    if not isinstance(dct, dict) or "formula" not in dct:
+        return jsonify(error="a formula is required"), 400
+
+    compound = dct["formula"]
+    try:
+        sld.formula(compound)
+    except Exception:
+        return jsonify(error=f"could not parse formula {compound!r}"), 400
+    solvent = dct.get("solvent", ("H2O", "D2O"))
+    if not isinstance(solvent, (list, tuple)) or len(solvent) != 2:
+        return jsonify(error="solvent must be a pair of formulae"), 400
+    for component in solvent:
+        try:
+            sld.formula(component)
+        except Exception:
+            return jsonify(error=f"could not parse formula {component!r}"), 400
+
+    try:
+        if "volume" in dct and "density" not in dct:
+            volume = float(dct["volume"])
+            if not volume > 0:
+                raise ValueError("volume must be positive")
+            density = sld.density_from_volume(compound, volume)
+        else:
+            density = float(dct["density"])
+        if not density > 0:
+            raise ValueError("density must be positive")
+        solvent_density = tuple(
+            float(v) for v in dct.get("solvent_density", (0.997, 1.107))
+        )
+        if len(solvent_density) != 2:
+            raise ValueError("solvent_density must be a pair of densities")
+        result = contrast.contrast_match(
+            compound,
+            density,
+            exchangeable=float(dct.get("exchangeable", 0)),
+            exchange_efficiency=float(dct.get("exchange_efficiency", 1)),
+            solvent=tuple(solvent),
+            solvent_density=solvent_density,
+            points=min(max(int(dct.get("points", 101)), 2), sld.MAX_GRID_POINTS),
+        )
+    except (KeyError, TypeError, ValueError, AssertionError) as e:
+        return jsonify(error=f"invalid request: {e}"), 400
+
+    return jsonify(
+        {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in result.items()}
+    )
+
+
+def _sld_form_spectrum(form):
+    """
+    Converts the form fields of the /sld page into an /api/sld request.
+    """
+    dct = {k: v for k, v in form.items()}
+    if dct.get("volumetype") == "volume":
+        dct.pop("density", None)
+    for name, grid in (("wavelength", "wavelengths"), ("energy", "energies")):
+        spec = {k: dct.get(f"{name}_{k}") for k in ("min", "max", "n")}
+        if all(spec.values()):
+            dct[grid] = spec
+    return dct
+
+
 def calculate_variables(d):
-    angles = [float(d["a1"]), float(d["a2"]), float(d["a3"]), float(d["a4"])]
-    footprint = float(d["footprint"])
-    lambdamin = float(d["lambdamin"])
-    lambdamax = float(d["lambdamax"])
-    L12 = float(d["L12"])
-    L2S = float(d["L2S"])
-    LS4 = float(d["LS4"])
-    LpreS1 = float(d["LpreS1"])
-    resolution = float(d["resolution"])
-
-    d["minqvals"] = [utils.qcalc(a, lambdamax) for a in angles]
-    d["maxqvals"] = [utils.qcalc(a, lambdamin) for a in angles]
-
-    d1, d2 = slitoptimiser.slitoptimiser(
-        footprint, resolution, L12=L12, L2S=L2S, verbose=False
+    """
+    Adds the derived quantities of the angulator page to `d`. Only the
+    values whose inputs changed since they were last calculated are
+    recomputed, see `variables_graph`. The names of those are added as
+    d["recomputed"].
+    """
+    inputs = {name: float(d[name]) for name in _VARIABLE_INPUTS}
+    inputs["diagonal"] = bool(d.get("diagonal"))
+    values, recomputed = variables_graph.evaluate(inputs)
+    telemetry.record_graph(recomputed)
+    d["recomputed"] = recomputed
+
+    rows = [values[name] for name in _COLUMNS["slits"]]
+    angles = [inputs[name] for name in ("a1", "a2", "a3", "a4")]
+    L12, L2S, LS4, LpreS1 = (inputs[k] for k in instruments.DISTANCES)
+
+    d["minqvals"] = [values[name] for name in _COLUMNS["minq"]]
+    d["maxqvals"] = [values[name] for name in _COLUMNS["maxq"]]
+    d["slit1"] = [row[0] for row in rows]
+    d["slit2"] = [row[1] for row in rows]
+    d["actualfootprint"] = [values[name] for name in _COLUMNS["footprint"]]
+    d["dtheta"] = [values[name] for name in _COLUMNS["dtheta"]]
+    d["beamfraction"] = [values[name] for name in _COLUMNS["beamfraction"]]
+    d["postsampleslit"] = [row[3] for row in rows]
+    d["preS1slit"] = [row[2] for row in rows]
+
+    if d.get("uncertainty"):
+        try:
+            nsamples = int(d.get("nsamples", 100000))
+            if not 0 < nsamples <= MAX_TOLERANCE_SAMPLES:
+                raise ValueError(
+                    f"the number of samples must be in (0, {MAX_TOLERANCE_SAMPLES}]"
+                )
+            d["uncertainty"] = tolerance.propagate(
+                np.array(d["slit1"]),
+                np.array(d["slit2"]),
+                np.array(angles),
+                L12,
+                L2S,
+                LS4,
+                LpreS1,
+                _form_tolerances(d),
+                nsamples=nsamples,
+            )
+        except ValueError as e:
+            d["uncertainty_error"] = str(e)
+
+
+_VARIABLE_INPUTS = (
+    "a1",
+    "a2",
+    "a3",
+    "a4",
+    "footprint",
+    "resolution",
+    "lambdamin",
+    "lambdamax",
+    *instruments.DISTANCES,
+    "d1_a4",
+    "d2_a4",
+    "length",
+    "width",
+)
+# the graph nodes of each column of the angulator table, one per row
+_COLUMNS = {
+    column: tuple(f"{column}[{n}]" for n in range(1, 5))
+    for column in ("minq", "maxq", "slits", "footprint", "dtheta", "beamfraction")
+}
+
+
+def _optimal_row(footprint, resolution, angle, L12, L2S, LS4, LpreS1):
+    return slit_settings(footprint, resolution, [angle], L12, L2S, LS4, LpreS1)[0]
+
+
+def _optimal_rows(args):
+    # the rows share the footprint, resolution and distances, only the
+    # angles differ
+    footprint, resolution, _, L12, L2S, LS4, LpreS1 = args[0]
+    angles = [angle for _, _, angle, *_ in args]
+    return slit_settings(footprint, resolution, angles, L12, L2S, LS4, LpreS1)
+
+
+def _override_row(d1, d2, L12, L2S, LS4, LpreS1):
+    return (
+        d1,
+        d2,
+        slitoptimiser.height_of_beam_after_dx(d1, d2, L12, -LpreS1),
+        slitoptimiser.height_of_beam_after_dx(d1, d2, L12, LS4 + L2S),
+    )
+
+
+def _beam_fraction(row, L12, L2S, angle, length, width, diagonal):
+    return float(
+        beamprofile.beam_fraction(
+            row[0], row[1], L12, L2S, angle, length, width, diagonal=diagonal
+        )
+    )
+
+
+def _variables_graph():
+    """
+    Dependency graph of the derived quantities of the angulator page. Every
+    row (angle) has its own nodes, so that e.g. changing a3 only recomputes
+    row 3, and changing lambdamin only the max Q column. The optimal slits
+    of rows that need recomputing together are solved in one batch.
+    """
+    graph = depgraph.Graph(
+        _VARIABLE_INPUTS + ("diagonal",),
+        maxsize=int(os.environ.get("REFCALC_GRAPH_CACHE_SIZE", 4096)),
     )
-    d["slit1"] = [d1 * angles[0], d1 * angles[1], d1 * angles[2], float(d["d1_a4"])]
-    d["slit2"] = [d2 * angles[0], d2 * angles[1], d2 * angles[2], float(d["d2_a4"])]
-    d["actualfootprint"] = [
-        slitoptimiser.actual_footprint(w1, w2, L12, L2S, a)
-        for w1, w2, a in zip(d["slit1"], d["slit2"], angles)
-    ]
-    d["dtheta"] = [utils.div(w1, w2, L12) for w1, w2 in zip(d["slit1"], d["slit2"])]
-    d["postsampleslit"] = [
-        slitoptimiser.height_of_beam_after_dx(w1, w2, L12, LS4 + L2S)
-        for w1, w2 in zip(d["slit1"], d["slit2"])
-    ]
-    d["preS1slit"] = [
-        slitoptimiser.height_of_beam_after_dx(w1, w2, L12, -LpreS1)
-        for w1, w2 in zip(d["slit1"], d["slit2"])
-    ]
+    distances = instruments.DISTANCES
+    for n in range(1, 5):
+        angle = f"a{n}"
+        graph.node(f"minq[{n}]", utils.qcalc, angle, "lambdamax")
+        graph.node(f"maxq[{n}]", utils.qcalc, angle, "lambdamin")
+        if n < 4:
+            graph.node(
+                f"slits[{n}]", _optimal_row, "footprint", "resolution", angle, *distances
+            )
+        else:
+            # the slits of the last angle are set by hand
+            graph.node(f"slits[{n}]", _override_row, "d1_a4", "d2_a4", *distances)
+        graph.node(
+            f"footprint[{n}]",
+            lambda row, L12, L2S, a: slitoptimiser.actual_footprint(
+                row[0], row[1], L12, L2S, a
+            ),
+            f"slits[{n}]",
+            "L12",
+            "L2S",
+            angle,
+        )
+        graph.node(
+            f"dtheta[{n}]",
+            lambda row, L12: utils.div(row[0], row[1], L12),
+            f"slits[{n}]",
+            "L12",
+        )
+        graph.node(
+            f"beamfraction[{n}]",
+            _beam_fraction,
+            f"slits[{n}]",
+            "L12",
+            "L2S",
+            angle,
+            "length",
+            "width",
+            "diagonal",
+        )
+    graph.batch(_optimal_rows, "slits[1]", "slits[2]", "slits[3]")
+    return graph
+
+
+variables_graph = _variables_graph()
+_caches["variables"] = variables_graph.memo
+
+
+def _form_tolerances(d):
+    """
+    Tolerances for `tolerance.propagate` from the tol_<input> (width) and
+    dist_<input> (distribution) fields of the /slits form. Inputs with a zero
+    or missing width are exact.
+    """
+    tolerances = {}
+    for name in tolerance.INPUTS:
+        width = float(d.get(f"tol_{name}") or 0)
+        if width > 0:
+            tolerances[name] = (d.get(f"dist_{name}", "normal"), width)
+    return tolerances
+
+
+def slit_settings(footprint, resolution, angles, L12, L2S, LS4, LpreS1):
+    """
+    Optimal slit settings for each angle, as a list of
+    (d1, d2, preS1slit, postsampleslit) tuples. Results are cached in
+    `slit_cache`, any misses are calculated in one vectorised pass.
+    """
+    geometry = cache.quantise(footprint, resolution, L12, L2S, LS4, LpreS1)
+    keys = [geometry + cache.quantise(angle) for angle in angles]
+    rows = [slit_cache.get(key) for key in keys]
+
+    missing = [i for i, row in enumerate(rows) if row is None]
+    if missing:
+        # identical concurrent requests share one calculation
+        computed = slit_flight.do(
+            tuple(keys[i] for i in missing),
+            _solve_slits,
+            [keys[i] for i in missing],
+            footprint,
+            resolution,
+            [angles[i] for i in missing],
+            L12,
+            L2S,
+            LS4,
+            LpreS1,
+        )
+        for i, row in zip(missing, computed):
+            rows[i] = row
+
+    return rows
+
+
+def _solve_slits(keys, footprint, resolution, angles, L12, L2S, LS4, LpreS1):
+    """
+    Calculates the `slit_settings` rows for `angles` in one vectorised pass,
+    and stores them in `slit_cache` under `keys`.
+    """
+    d1, d2, info = slitoptimiser.slitoptimiser_batch(
+        footprint,
+        resolution,
+        angles,
+        L12=L12,
+        L2S=L2S,
+        method="table",
+        full_output=True,
+    )
+    telemetry.record_solver(info)
+    rows = []
+    for key, w1, w2 in zip(keys, d1.tolist(), d2.tolist()):
+        row = (
+            w1,
+            w2,
+            slitoptimiser.height_of_beam_after_dx(w1, w2, L12, -LpreS1),
+            slitoptimiser.height_of_beam_after_dx(w1, w2, L12, LS4 + L2S),
+        )
+        slit_cache.put(key, row)
+        rows.append(row)
+    return rows
 
 
 if __name__ == "__main__":
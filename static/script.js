@@ -89,4 +89,180 @@ function updateq(){
 
 function q(angle, wavelength){
     return (4 * Math.PI * Math.sin(angle * Math.PI / 180.) / wavelength).toFixed(4);
-};
\ No newline at end of file
+};
+
+// Slit settings are recalculated in the browser from the normalised slit
+// solution table of the instrument (see /api/slittable), mirroring
+// slitoptimiser.slitoptimiser_batch(..., method="table"). If the distances
+// are edited so that L2S / L12 no longer matches the table the values are
+// left as they are, and are updated by the server when the form is submitted.
+const calculator = document.getElementById('calculator');
+const LpreS1 = document.getElementById('LpreS1');
+const L12 = document.getElementById('L12');
+const L2S = document.getElementById('L2S');
+const LS4 = document.getElementById('LS4');
+const footprint = document.getElementById('footprint');
+const resolution = document.getElementById('resolution');
+const d1_a4 = document.getElementById('d1_a4');
+const d2_a4 = document.getElementById('d2_a4');
+const diagonal = document.getElementById('diagonal');
+
+let slittable = null;
+
+fetch(calculator.dataset.slittable)
+    .then((response) => response.json())
+    .then((table) => {
+        slittable = table;
+    });
+
+for (const input of [LpreS1, L12, L2S, LS4, footprint, resolution, d1_a4, d2_a4, a1, a2, a3, a4, length, width]) {
+    input.addEventListener('input', (event) => {
+        updateslits();
+    });
+}
+
+function interp(x, xp, fp){
+    // linear interpolation, xp is increasing
+    let lo = 0;
+    let hi = xp.length - 1;
+    while (hi - lo > 1) {
+        const mid = (lo + hi) >> 1;
+        if (xp[mid] > x) {
+            hi = mid;
+        } else {
+            lo = mid;
+        }
+    }
+    return fp[lo] + (fp[hi] - fp[lo]) * (x - xp[lo]) / (xp[hi] - xp[lo]);
+};
+
+function optimalslits(footprint, resolution, angle, L12, L2S){
+    // returns [d1, d2], or null if the table can't be used
+    const L1star = 0.68 * footprint / L12 / resolution;
+    const xp = slittable.L1star;
+    if (!(L1star > xp[0]) || Math.abs(L2S / L12 - slittable.ratio) > 1e-9) {
+        return null;
+    }
+    const d2star = L1star > xp[xp.length - 1] ? 1 : interp(L1star, xp, slittable.d2star);
+    let d1star = Math.sqrt(1 - d2star ** 2);
+    let multfactor = d2star / d1star;
+    if (d2star > d1star) {
+        // clamp to equal slits
+        d1star = 1 / Math.sqrt(2);
+        multfactor = 1;
+    }
+    const d1 = d1star * resolution / 0.68 * angle * Math.PI / 180 * L12;
+    return [d1, d1 * multfactor];
+};
+
+function cumulative(x, a, b){
+    // integral of the unit height trapezoid from 0 to x, see beamprofile.py
+    x = Math.min(x, b);
+    if (x <= a) {
+        return x;
+    }
+    return x - (x - a) ** 2 / (2 * (b - a));
+};
+
+function beamfraction(d1, d2, L12, L2S, angle){
+    let len = Number(length.value);
+    if (diagonal.checked) {
+        len = Math.hypot(len, Number(width.value));
+    }
+    const w1 = d1 * L2S / L12;
+    const w2 = d2 * (L12 + L2S) / L12;
+    const a = Math.abs(w2 - w1) / 2;
+    const b = (w1 + w2) / 2;
+    if (!(a + b > 0)) {
+        return 0;
+    }
+    return 2 * cumulative(len * Math.sin(angle * Math.PI / 180) / 2, a, b) / (a + b);
+};
+
+function updateslits(){
+    if (slittable === null) {
+        return;
+    }
+    const l12 = Number(L12.value);
+    const l2s = Number(L2S.value);
+    const ls4 = Number(LS4.value);
+    const lpres1 = Number(LpreS1.value);
+    const angles = [a1, a2, a3, a4].map((a) => Number(a.value));
+
+    const rows = [];
+    for (let i = 0; i < 3; i++) {
+        const slits = optimalslits(Number(footprint.value), Number(resolution.value), angles[i], l12, l2s);
+        if (slits === null) {
+            return;
+        }
+        rows.push(slits);
+    }
+    rows.push([Number(d1_a4.value), Number(d2_a4.value)]);
+
+    rows.forEach(([d1, d2], i) => {
+        const n = i + 1;
+        const angle = angles[i];
+        const alpha = (d1 + d2) / 2 / l12;
+        const beta = Math.abs(d1 - d2) / 2 / l12;
+        document.getElementById('w1_' + n).textContent = (alpha * lpres1 * 2 + d1).toFixed(3);
+        if (n < 4) {
+            document.getElementById('w2_' + n).textContent = d1.toFixed(3);
+            document.getElementById('w3_' + n).textContent = d2.toFixed(3);
+        }
+        document.getElementById('w4_' + n).textContent = (alpha * (ls4 + l2s) * 2 + d2).toFixed(3);
+
+        const dtheta = 0.68 * Math.sqrt(d1 ** 2 + d2 ** 2) / l12 * 180 / Math.PI;
+        document.getElementById('dtheta_' + n).textContent = dtheta.toFixed(4);
+        document.getElementById('beamfraction_' + n).textContent = beamfraction(d1, d2, l12, l2s, angle).toFixed(3);
+
+        // the footprint column is shown in the rows of angles 2 and N, with
+        // the values of angles 1 and N
+        const cell = {1: 'footprint_2', 4: 'footprint_4'}[n];
+        if (cell) {
+            const radians = angle * Math.PI / 180;
+            const umbra = (beta * l2s * 2 + d2) / radians;
+            const penumbra = (alpha * l2s * 2 + d2) / radians;
+            document.getElementById(cell).textContent = penumbra.toFixed(3) + ' / ' + umbra.toFixed(3);
+        }
+    });
+};
+
+
+// Flux-optimal footprint and resolution for the sample (see /api/flux),
+// for the first three angles. The slits are then recalculated as usual.
+const max_resolution = document.getElementById('max_resolution');
+const fluxoptimise = document.getElementById('fluxoptimise');
+const instrument = calculator.elements['instrument'];
+
+fluxoptimise.addEventListener('click', (event) => {
+    fetch('/api/flux', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+            instrument: instrument.value,
+            L12: Number(L12.value),
+            L2S: Number(L2S.value),
+            length: Number(length.value),
+            width: Number(width.value),
+            diagonal: diagonal.checked,
+            objective: 'beamfraction',
+            max_resolution: Number(max_resolution.value),
+            angles: [a1, a2, a3].map((a) => Number(a.value)),
+        }),
+    })
+        .then((response) => response.json())
+        .then((result) => {
+            if (result.error) {
+                return;
+            }
+            footprint.value = result.footprint[0].toFixed(2);
+            // round down to the 0.001 step of the input, staying within the
+            // maximum resolution
+            resolution.value = (Math.floor(result.resolution[0] * 1000 + 1e-9) / 1000).toFixed(3);
+            if (slittable === null || Math.abs(Number(L2S.value) / Number(L12.value) - slittable.ratio) > 1e-9) {
+                calculator.submit();
+            } else {
+                updateslits();
+            }
+        });
+});